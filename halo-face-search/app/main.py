@@ -4,15 +4,43 @@ Halo Face Search API - Complete Implementation
 """
 
 from fastapi import FastAPI, UploadFile, File, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.concurrency import run_in_threadpool
 import uvicorn
+import asyncio
 from pymilvus import MilvusClient, DataType, CollectionSchema, FieldSchema
 from deepface import DeepFace
 import numpy as np
-import tempfile
+import cv2
 import os
+import sys
+import hashlib
+import queue
+import threading
+import time
 import warnings
+from types import SimpleNamespace
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import List, Optional
+
+try:
+    import onnxruntime as ort
+except ImportError:
+    ort = None
+
+try:
+    from numba import njit, prange
+except ImportError:
+    njit = None
+
+try:
+    from insightface.app import FaceAnalysis
+    from insightface.utils import face_align
+except ImportError:
+    FaceAnalysis = None
 
 warnings.filterwarnings("ignore")
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
@@ -20,7 +48,8 @@ os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
 app = FastAPI(
     title="Halo Face Search API",
     description="Real-time face similarity search service",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse
 )
 
 app.add_middleware(
@@ -44,46 +73,231 @@ else:
     MILVUS_URI = os.getenv("MILVUS_URI", "http://localhost:19530")
     print("🏠 Local development - using Milvus server")
 
-milvus_client = MilvusClient(uri=MILVUS_URI)
+class MilvusClientPool:
+    """Bounded pool of MilvusClient instances, each with its own gRPC channel"""
+    
+    def __init__(self, uri: str, max_size: int):
+        self.uri = uri
+        self.max_size = max_size
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+    
+    @contextmanager
+    def client(self):
+        """Borrow a client, creating one lazily until max_size is reached"""
+        try:
+            client = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_create = self._created < self.max_size
+                if can_create:
+                    self._created += 1
+            if can_create:
+                try:
+                    client = MilvusClient(uri=self.uri)
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            else:
+                client = self._idle.get()
+        
+        try:
+            yield client
+        finally:
+            self._idle.put(client)
+
+milvus_client = MilvusClient(uri=MILVUS_URI)  # startup / admin calls
+# Milvus Lite is an embedded single-file database, so only pool connections to a real server
+MILVUS_POOL_SIZE = int(os.getenv("MILVUS_POOL_SIZE", 1 if os.getenv("RAILWAY_ENVIRONMENT") else 8))
+milvus_pool = MilvusClientPool(MILVUS_URI, MILVUS_POOL_SIZE)
 COLLECTION_NAME = "face_embeddings"
 DIMENSION = 512
+INSERT_BATCH_SIZE = 1000  # rows per Milvus insert call
+
+# HNSW keeps full float32 vectors; IVF_SQ8 stores int8 codes (4x less memory, small recall loss);
+# GPU_CAGRA is the graph index for GPU-enabled Milvus deployments
+MILVUS_INDEX_TYPE = os.getenv("MILVUS_INDEX_TYPE", "HNSW").upper()
+INDEX_BUILD_PARAMS = {
+    "HNSW": {"M": 16, "efConstruction": 200},
+    "IVF_SQ8": {"nlist": int(os.getenv("IVF_NLIST", 128))},
+    "GPU_CAGRA": {"intermediate_graph_degree": 64, "graph_degree": 32},
+}
+SEARCH_PARAMS = {
+    "HNSW": {},
+    "IVF_SQ8": {"nprobe": int(os.getenv("IVF_NPROBE", 16))},
+    "GPU_CAGRA": {},
+}
+
+# FLOAT16_VECTOR halves vector memory and bandwidth in Milvus; unit-norm ArcFace scores barely move in fp16.
+# New collections use MILVUS_VECTOR_TYPE; an existing collection's own field type always wins
+MILVUS_VECTOR_TYPE = os.getenv("MILVUS_VECTOR_TYPE", "FLOAT16_VECTOR").upper()
+VECTOR_DTYPE = np.float16 if MILVUS_VECTOR_TYPE == "FLOAT16_VECTOR" else np.float32
+
+def detect_vector_dtype():
+    """Match VECTOR_DTYPE to the embedding field of the collection as it exists in Milvus"""
+    global VECTOR_DTYPE
+    for field in milvus_client.describe_collection(COLLECTION_NAME)["fields"]:
+        if field["name"] == "embedding":
+            VECTOR_DTYPE = np.float16 if field["type"] == DataType.FLOAT16_VECTOR else np.float32
+
+# New collections are COSINE-indexed as they always were; an existing collection's own index metric
+# always wins (the milvus_manager collections, for one, are L2)
+METRIC_TYPE = "COSINE"
+
+def detect_metric_type():
+    """Match METRIC_TYPE to the embedding index of the collection as it exists in Milvus"""
+    global METRIC_TYPE
+    for index_name in milvus_client.list_indexes(COLLECTION_NAME, field_name="embedding"):
+        METRIC_TYPE = milvus_client.describe_index(COLLECTION_NAME, index_name).get("metric_type", METRIC_TYPE)
+
+def to_milvus_vector(embedding) -> np.ndarray:
+    """Cast a float32 embedding to the collection's vector dtype for insert or search"""
+    return np.asarray(embedding).astype(VECTOR_DTYPE, copy=False)
+
+def from_milvus_vector(value) -> np.ndarray:
+    """Decode a returned vector field (float list, or fp16 bytes wrapped in a list) to float32"""
+    if isinstance(value, list) and value and isinstance(value[0], bytes):
+        value = value[0]
+    if isinstance(value, (bytes, bytearray)):
+        return np.frombuffer(value, dtype=np.float16).astype(np.float32)
+    return np.asarray(value, dtype=np.float32)
+
+# Optional two-stage search: sign-bit codes (64 bytes/face) in a Hamming-indexed side collection
+# shortlist candidates, then the float vectors of only those candidates are re-scored exactly
+BINARY_PREFILTER = os.getenv("BINARY_PREFILTER", "false").lower() == "true"
+BIN_COLLECTION_NAME = "face_embeddings_bin"
+BIN_CANDIDATE_FACTOR = 4  # shortlist top_k * this many codes
+_binary_ready = False  # every face has a code in the side collection, so it can serve searches
+# get_row_count() as of the last backfill, advanced by rows coded on insert; rows beyond it
+# (added by the ingest scripts or another worker) have no code yet
+_binary_synced_rows = 0
+_binary_backfill_lock = threading.Lock()
+
+# Optional in-process copy of every embedding: exact top-K is one matmul, Milvus only serves metadata
+LOCAL_SHORTLIST = os.getenv("LOCAL_SHORTLIST", "false").lower() == "true"
+LOCAL_SHORTLIST_MAX_ROWS = int(os.getenv("LOCAL_SHORTLIST_MAX_ROWS", 100000))
+# float16 halves the mirror's RAM; rows are upcast a block at a time so scoring still runs on SGEMM
+LOCAL_SHORTLIST_DTYPE = np.dtype(os.getenv("LOCAL_SHORTLIST_DTYPE", "float32"))
+LOCAL_SCAN_BLOCK = 4096
+# Face metadata never changes after insert, so keep it next to the mirror and prefetch
+# the ranks just past top_k in the same get() (a repeat or deeper query then needs no RPC)
+METADATA_CACHE_SIZE = int(os.getenv("METADATA_CACHE_SIZE", 10000))
+METADATA_PREFETCH = int(os.getenv("METADATA_PREFETCH", 10))
+
+# HNSW search depth; calibrated at startup to the smallest candidate reaching TARGET_RECALL@5
+EF_SEARCH = int(os.getenv("EF_SEARCH", 64))
+EF_CANDIDATES = (32, 64, 128, 256)
+MAX_EF = 32768  # Milvus rejects a larger HNSW ef
+TARGET_RECALL = 0.95
+
+# Local row counter so hot paths don't pay a get_collection_stats round-trip.
+# Other workers insert too, so reconcile with Milvus after a TTL or enough local inserts.
+ROW_COUNT_TTL = float(os.getenv("ROW_COUNT_TTL", 5))
+ROW_COUNT_RECONCILE_EVERY = 100
+_row_count = None
+_row_count_at = 0.0
+_inserts_since_refresh = 0
+_row_count_lock = threading.Lock()
+
+def refresh_row_count() -> int:
+    """Re-read the row count from Milvus and update the local counter"""
+    global _row_count, _row_count_at, _inserts_since_refresh
+    count = milvus_client.get_collection_stats(COLLECTION_NAME).get('row_count', 0)
+    with _row_count_lock:
+        _row_count = int(count)
+        _row_count_at = time.monotonic()
+        _inserts_since_refresh = 0
+        return _row_count
+
+def get_row_count() -> int:
+    """Return the cached row count, re-reading it from Milvus only when stale"""
+    if (_row_count is None
+            or time.monotonic() - _row_count_at > ROW_COUNT_TTL
+            or _inserts_since_refresh >= ROW_COUNT_RECONCILE_EVERY):
+        return refresh_row_count()
+    return _row_count
+
+def increment_row_count(inserted: int):
+    global _row_count, _inserts_since_refresh
+    with _row_count_lock:
+        if _row_count is not None:
+            _row_count += inserted
+            _inserts_since_refresh += inserted
+
+class EmbeddingCache:
+    """Bounded LRU of query embeddings keyed by a hash of the raw image bytes"""
+    
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    @staticmethod
+    def key_for(content: bytes) -> str:
+        return hashlib.blake2b(content, digest_size=16).hexdigest()
+    
+    def get(self, key: str) -> Optional[np.ndarray]:
+        with self._lock:
+            embedding = self._entries.get(key)
+            if embedding is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return embedding
+    
+    def put(self, key: str, embedding: np.ndarray):
+        with self._lock:
+            self._entries[key] = embedding
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+    
+    def get_stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+embedding_cache = EmbeddingCache(maxsize=int(os.getenv("EMBEDDING_CACHE_SIZE", 1024)))
 
 @app.on_event("startup")
 async def startup_event():
+    global EF_SEARCH
     try:
         print("🚀 Starting Halo Face Search API...")
         
         # Pre-load DeepFace model for better performance
         print("⚡ Pre-loading ArcFace model...")
-        import tempfile
-        import numpy as np
-        from PIL import Image
         
-        # Create a dummy image to warm up DeepFace
-        dummy_img = Image.new('RGB', (224, 224), color='white')
-        with tempfile.NamedTemporaryFile(suffix='.jpg', delete=False) as tmp:
-            dummy_img.save(tmp.name)
-            try:
-                DeepFace.represent(
-                    img_path=tmp.name,
-                    model_name="ArcFace",
-                    detector_backend="opencv",
-                    enforce_detection=False
-                )
-                print("✅ ArcFace model pre-loaded successfully!")
-            except:
-                print("⚠️  Model pre-loading failed, will load on first request")
-            finally:
-                import os
-                if os.path.exists(tmp.name):
-                    os.unlink(tmp.name)
+        try:
+            # Load the ONNX session if exported, otherwise the Keras model
+            app.state.onnx_session = get_onnx_session()
+            if app.state.onnx_session is not None:
+                print(f"✅ ArcFace ONNX session loaded from {ARCFACE_ONNX_PATH} "
+                      f"({app.state.onnx_session.get_providers()[0]})")
+            else:
+                app.state.arcface_model = get_arcface_model()
+            warm_up_inference()
+            print("✅ ArcFace model pre-loaded successfully!")
+        except:
+            print("⚠️  Model pre-loading failed, will load on first request")
         
         # Initialize Milvus
         if not milvus_client.has_collection(COLLECTION_NAME):
             schema = CollectionSchema([
                 FieldSchema(name="id", dtype=DataType.INT64, is_primary=True, auto_id=True),
                 FieldSchema(name="face_id", dtype=DataType.VARCHAR, max_length=100),
-                FieldSchema(name="embedding", dtype=DataType.FLOAT_VECTOR, dim=DIMENSION),
+                FieldSchema(name="embedding", dtype=DataType[MILVUS_VECTOR_TYPE], dim=DIMENSION),
                 FieldSchema(name="image_path", dtype=DataType.VARCHAR, max_length=500),
                 FieldSchema(name="person_name", dtype=DataType.VARCHAR, max_length=200)
             ])
@@ -93,45 +307,697 @@ async def startup_event():
                 schema=schema,
                 index_params={
                     "field_name": "embedding",
-                    "index_type": "HNSW", 
-                    "metric_type": "COSINE",
-                    "params": {"M": 16, "efConstruction": 200}
+                    "index_type": MILVUS_INDEX_TYPE,
+                    "metric_type": METRIC_TYPE,
+                    "params": INDEX_BUILD_PARAMS[MILVUS_INDEX_TYPE]
                 }
             )
-            print(f"✅ Created collection: {COLLECTION_NAME}")
+            print(f"✅ Created collection: {COLLECTION_NAME} ({MILVUS_INDEX_TYPE} index)")
         
+        detect_vector_dtype()
+        detect_metric_type()
         milvus_client.load_collection(COLLECTION_NAME)
-        stats = milvus_client.get_collection_stats(COLLECTION_NAME)
-        print(f"📊 Database contains {stats.get('row_count', 0)} face embeddings")
+        
+        if BINARY_PREFILTER:
+            init_binary_collection()
+        
+        if LOCAL_SHORTLIST:
+            local_index.reload()
+            print(f"🧠 Local embedding matrix holds {local_index.count} faces")
+        print(f"📊 Database contains {refresh_row_count()} face embeddings")
+        
+        if MILVUS_INDEX_TYPE == "HNSW" and os.getenv("EF_CALIBRATE", "true").lower() == "true":
+            try:
+                EF_SEARCH, recall = calibrate_ef()
+                if recall is not None:
+                    print(f"🎚️  HNSW ef={EF_SEARCH} (recall@5 {recall:.3f} vs ef={2 * max(EF_CANDIDATES)})")
+            except Exception as e:
+                print(f"⚠️  ef calibration failed, using ef={EF_SEARCH}: {e}")
         print("🎯 Halo Face Search API ready!")
         
     except Exception as e:
         print(f"❌ Error initializing: {e}")
+    
+    face_batcher.start()
+    search_batcher.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await face_batcher.stop()
+    await search_batcher.stop()
+    EMBED_POOL.shutdown(wait=False)
+
+def decode_image(content: bytes) -> np.ndarray:
+    """Decode uploaded image bytes straight to a BGR array (no temp file round-trip)"""
+    img = cv2.imdecode(np.frombuffer(content, np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        raise HTTPException(status_code=400, detail="Could not decode image")
+    return img
+
+if njit is not None:
+    @njit(parallel=True, fastmath=True, cache=True)
+    def l2_normalize_rows(vectors):
+        """Scale each row to unit length in place (one pass, no norm temporaries)"""
+        for i in prange(vectors.shape[0]):
+            s = np.float32(0.0)
+            for j in range(vectors.shape[1]):
+                s += vectors[i, j] * vectors[i, j]
+            inv = np.float32(1.0) / np.sqrt(s)
+            for j in range(vectors.shape[1]):
+                vectors[i, j] *= inv
+        return vectors
+else:
+    l2_normalize_rows = None
+
+# ArcFace expects 112x112 aligned crops
+ARCFACE_INPUT_SIZE = (112, 112)
+_arcface_model = None
+
+# Optional ONNX export of ArcFace (see scripts/export_arcface_onnx.py)
+ARCFACE_ONNX_PATH = os.getenv("ARCFACE_ONNX_PATH", "models/arcface.onnx")
+_onnx_session = None
+
+# Server processes sharing this machine (uvicorn also reads WEB_CONCURRENCY); each one's ONNX
+# session gets an equal share of the cores instead of all of them
+WORKERS = int(os.getenv("WORKERS", os.getenv("WEB_CONCURRENCY", 1)))
+
+# SCRFD (InsightFace) detects and returns 5-point landmarks in one ONNX pass. Opt-in: stored embeddings
+# come from the ingest scripts' OpenCV crops, and query crops must match them until the database is rebuilt
+FACE_DETECTOR = os.getenv("FACE_DETECTOR", "opencv").lower()
+SCRFD_DET_SIZE = (320, 320)
+_scrfd_detector = None
 
-def extract_face_embedding(image_path: str) -> np.ndarray:
+def get_arcface_model():
+    """Build the ArcFace model once and reuse it for batched inference"""
+    global _arcface_model
+    if _arcface_model is None:
+        _arcface_model = DeepFace.build_model("ArcFace")
+    return _arcface_model
+
+def get_onnx_session():
+    """Create the ONNX Runtime ArcFace session once, if onnxruntime and the model exist"""
+    global _onnx_session
+    if _onnx_session is None and ort is not None and os.path.exists(ARCFACE_ONNX_PATH):
+        sess_options = ort.SessionOptions()
+        sess_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        sess_options.intra_op_num_threads = max(1, (os.cpu_count() or 1) // WORKERS)
+        sess_options.enable_mem_pattern = True
+        sess_options.enable_cpu_mem_arena = True
+        available = ort.get_available_providers()
+        providers = [p for p in ("CUDAExecutionProvider", "CPUExecutionProvider") if p in available]
+        _onnx_session = ort.InferenceSession(
+            ARCFACE_ONNX_PATH,
+            sess_options=sess_options,
+            providers=providers
+        )
+    return _onnx_session
+
+def get_scrfd_detector():
+    """Load InsightFace's SCRFD detector once, if insightface is installed and selected"""
+    global _scrfd_detector
+    if _scrfd_detector is None and FaceAnalysis is not None and FACE_DETECTOR == "scrfd":
+        providers = ["CPUExecutionProvider"]
+        if ort is not None and "CUDAExecutionProvider" in ort.get_available_providers():
+            providers.insert(0, "CUDAExecutionProvider")
+        analysis = FaceAnalysis(allowed_modules=["detection"], providers=providers)
+        analysis.prepare(ctx_id=0, det_size=SCRFD_DET_SIZE)
+        _scrfd_detector = analysis.det_model
+    return _scrfd_detector
+
+def preprocess_face(img) -> np.ndarray:
+    """Detect and align a face, returning a (112, 112, 3) crop ready for ArcFace"""
+    detector = get_scrfd_detector()
+    if detector is not None:
+        return preprocess_face_scrfd(detector, img)
+    
     try:
-        embedding_obj = DeepFace.represent(
-            img_path=image_path,
-            model_name="ArcFace",
-            detector_backend="opencv", 
+        face_objs = DeepFace.extract_faces(
+            img_path=img,
+            target_size=ARCFACE_INPUT_SIZE,
+            detector_backend="opencv",
             enforce_detection=False,
-            align=True,
-            normalization="base"
+            align=True
         )
-        embedding = np.array(embedding_obj[0]["embedding"])
-        return embedding / np.linalg.norm(embedding)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Face detection failed: {str(e)}")
+    
+    # extract_faces returns RGB for display; ArcFace takes the BGR layout represent() feeds it
+    return face_objs[0]["face"][:, :, ::-1]
+
+def preprocess_face_scrfd(detector, img: np.ndarray) -> np.ndarray:
+    """SCRFD detection + 5-point similarity warp to the canonical ArcFace crop"""
+    try:
+        _, landmarks = detector.detect(img, max_num=1)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Face detection failed: {str(e)}")
+    
+    # Like enforce_detection=False: no face found means embed the whole frame
+    if landmarks is None or len(landmarks) == 0:
+        crop = cv2.resize(img, ARCFACE_INPUT_SIZE)
+    else:
+        crop = face_align.norm_crop(img, landmark=landmarks[0], image_size=ARCFACE_INPUT_SIZE[0])
+    
+    # Already BGR; scale to the [0, 1] range extract_faces produces
+    return crop.astype(np.float32) / 255.0
+
+def embed_faces(faces: np.ndarray) -> np.ndarray:
+    """Run ArcFace on a (B, 112, 112, 3) batch and L2-normalize each embedding"""
+    session = get_onnx_session()
+    if session is not None:
+        input_name = session.get_inputs()[0].name
+        embeddings = session.run(None, {input_name: faces.astype(np.float32, copy=False)})[0]
+    else:
+        # deepface 0.0.79 (pinned) returns the Keras model itself; newer releases wrap it in .model
+        model = get_arcface_model()
+        embeddings = getattr(model, "model", model)(faces, training=False).numpy()
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    if l2_normalize_rows is not None:
+        return l2_normalize_rows(embeddings)
+    # One fused reduction over the (B, 512) block, then one broadcast multiply
+    embeddings = embeddings.astype(np.float32, copy=False)
+    embeddings *= np.reciprocal(np.sqrt(np.einsum('ij,ij->i', embeddings, embeddings)))[:, None]
+    return embeddings
+
+class EmbeddingBatcher:
+    """Coalesce aligned faces from concurrent requests into one ArcFace forward pass"""
+    
+    def __init__(self, max_batch: int = 8, window_ms: float = 15.0):
+        self.max_batch = max_batch
+        self.window = window_ms / 1000.0
+        self._queue = None
+        self._task = None
+    
+    def start(self):
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+    
+    async def submit(self, face: np.ndarray) -> np.ndarray:
+        """Queue one (112, 112, 3) face and wait for its embedding"""
+        if self._task is None:
+            return (await run_in_threadpool(embed_faces, face[np.newaxis]))[0]
+        
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((face, future))
+        return await future
+    
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            
+            # Keep collecting until the batch is full or the window closes
+            deadline = loop.time() + self.window
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            
+            faces = np.stack([face for face, _ in batch])
+            try:
+                embeddings = await run_in_threadpool(embed_faces, faces)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            
+            for (_, future), embedding in zip(batch, embeddings):
+                if not future.done():
+                    future.set_result(embedding)
+
+face_batcher = EmbeddingBatcher(
+    max_batch=int(os.getenv("EMBED_BATCH_MAX", 8)),
+    window_ms=float(os.getenv("EMBED_BATCH_WINDOW_MS", 15))
+)
+
+# Decode + face detection get their own small pool so a burst of uploads can't
+# oversubscribe the cores ArcFace needs or starve Starlette's shared threadpool
+EMBED_POOL_SIZE = int(os.getenv("EMBED_POOL_SIZE", min(4, os.cpu_count() or 1)))
+EMBED_POOL = ThreadPoolExecutor(max_workers=EMBED_POOL_SIZE, thread_name_prefix="embed")
+
+def warm_up_inference(rounds: int = 3):
+    """Run the real request path at real shapes so no request pays for lazy init or autotuning"""
+    dummy_face = np.zeros((*ARCFACE_INPUT_SIZE, 3), dtype=np.uint8)
+    
+    # Face detector on every embedding-pool thread (load it once first so threads don't race to build it)
+    get_scrfd_detector()
+    list(EMBED_POOL.map(lambda _: preprocess_face(dummy_face), range(EMBED_POOL_SIZE)))
+    
+    # ArcFace at the single-request and full-batch shapes the batcher produces
+    for _ in range(rounds):
+        for batch_size in (1, face_batcher.max_batch):
+            embed_faces(np.zeros((batch_size, *ARCFACE_INPUT_SIZE, 3), dtype=np.float32))
+
+async def embed_image_bytes(content: bytes) -> np.ndarray:
+    """Decode and align off the event loop, then embed through the shared ArcFace batch"""
+    loop = asyncio.get_running_loop()
+    face = await loop.run_in_executor(EMBED_POOL, lambda: preprocess_face(decode_image(content)))
+    try:
+        return await face_batcher.submit(face)
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Face embedding failed: {str(e)}")
 
+def binarize(embeddings) -> list:
+    """Pack the sign bits of each embedding into 64 bytes for a BINARY_VECTOR field"""
+    bits = np.packbits(np.atleast_2d(embeddings) > 0, axis=1)
+    return [row.tobytes() for row in bits]
+
+def init_binary_collection():
+    """Create and load the Hamming side collection; ids mirror the float collection's primary keys"""
+    if not milvus_client.has_collection(BIN_COLLECTION_NAME):
+        schema = CollectionSchema([
+            FieldSchema(name="id", dtype=DataType.INT64, is_primary=True, auto_id=False),
+            FieldSchema(name="bvec", dtype=DataType.BINARY_VECTOR, dim=DIMENSION)
+        ])
+        milvus_client.create_collection(
+            collection_name=BIN_COLLECTION_NAME,
+            schema=schema,
+            index_params={
+                "field_name": "bvec",
+                "index_type": "BIN_IVF_FLAT",
+                "metric_type": "HAMMING",
+                "params": {"nlist": int(os.getenv("IVF_NLIST", 128))}
+            }
+        )
+        print(f"✅ Created collection: {BIN_COLLECTION_NAME} (BIN_IVF_FLAT / HAMMING)")
+    milvus_client.load_collection(BIN_COLLECTION_NAME)
+    sync_binary_codes()
+
+def sync_binary_codes():
+    """Backfill codes for faces that have none; searches stay on the float collection until they do"""
+    global _binary_ready, _binary_synced_rows
+    # Read before the scan, so rows inserted while it runs trigger another backfill
+    rows_at_start = refresh_row_count()
+    bin_count = int(milvus_client.get_collection_stats(BIN_COLLECTION_NAME).get('row_count', 0))
+    if bin_count < rows_at_start:
+        print(f"🔁 {BIN_COLLECTION_NAME} has {bin_count} codes for {rows_at_start} faces, backfilling...")
+        try:
+            print(f"✅ Wrote binary codes for {backfill_binary_codes()} faces")
+        except Exception as e:
+            print(f"⚠️  Binary code backfill failed, searching float vectors only: {e}")
+            return
+    _binary_synced_rows = rows_at_start
+    _binary_ready = True
+
+def sync_binary_codes_in_background():
+    """Start a background backfill unless one is already running"""
+    if not _binary_backfill_lock.acquire(blocking=False):
+        return
+    
+    def run():
+        try:
+            sync_binary_codes()
+        except Exception as e:
+            print(f"⚠️  Binary code backfill failed: {e}")
+        finally:
+            _binary_backfill_lock.release()
+    
+    threading.Thread(target=run, name="binary-code-backfill", daemon=True).start()
+
+def backfill_binary_codes() -> int:
+    """Upsert a code for every row of the float collection; already-coded ids are just overwritten"""
+    written = 0
+    iterator = milvus_client.query_iterator(
+        collection_name=COLLECTION_NAME,
+        batch_size=1000,
+        filter="",
+        output_fields=["embedding"]
+    )
+    while True:
+        rows = iterator.next()
+        if not rows:
+            iterator.close()
+            break
+        codes = binarize(np.stack([from_milvus_vector(row["embedding"]) for row in rows]))
+        milvus_client.upsert(
+            collection_name=BIN_COLLECTION_NAME,
+            data=[{"id": row["id"], "bvec": code} for row, code in zip(rows, codes)]
+        )
+        written += len(rows)
+    return written
+
+class LocalEmbeddingIndex:
+    """In-process float32 matrix of the collection's embeddings, keyed by Milvus primary key"""
+    
+    def __init__(self):
+        self._ids = np.empty(0, dtype=np.int64)
+        self._matrix = np.empty((0, DIMENSION), dtype=LOCAL_SHORTLIST_DTYPE)
+        self.count = 0
+        self.ready = False
+        # get_row_count() as of the last mirror; compared like for like, rows Milvus still counts
+        # after a delete can't keep triggering reloads
+        self.synced_rows = 0
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+    
+    def reload(self):
+        """Pull every embedding from Milvus; skipped when the collection is too large to mirror"""
+        # Read before the scan, so rows inserted while it runs trigger another refresh
+        rows_at_start = refresh_row_count()
+        if rows_at_start > LOCAL_SHORTLIST_MAX_ROWS:
+            self.ready = False
+            self.synced_rows = rows_at_start
+            return
+        ids, vectors = [], []
+        iterator = milvus_client.query_iterator(
+            collection_name=COLLECTION_NAME,
+            batch_size=1000,
+            filter="",
+            output_fields=["embedding"]
+        )
+        while True:
+            rows = iterator.next()
+            if not rows:
+                iterator.close()
+                break
+            ids.extend(row["id"] for row in rows)
+            vectors.extend(from_milvus_vector(row["embedding"]) for row in rows)
+        
+        with self._lock:
+            self._ids = np.asarray(ids, dtype=np.int64)
+            self._matrix = np.asarray(vectors, dtype=LOCAL_SHORTLIST_DTYPE).reshape(-1, DIMENSION)
+            self.count = len(ids)
+            self.synced_rows = rows_at_start
+            self.ready = True
+    
+    def refresh_in_background(self):
+        """Start a background reload unless one is already running"""
+        if not self._reload_lock.acquire(blocking=False):
+            return
+        
+        def run():
+            try:
+                self.reload()
+            except Exception as e:
+                print(f"⚠️  Local embedding reload failed: {e}")
+            finally:
+                self._reload_lock.release()
+        
+        threading.Thread(target=run, name="local-index-refresh", daemon=True).start()
+    
+    def add(self, ids: list, embeddings: np.ndarray):
+        """Append freshly inserted rows, doubling capacity on overflow"""
+        with self._lock:
+            needed = self.count + len(ids)
+            if needed > self._matrix.shape[0]:
+                capacity = max(needed, 2 * self._matrix.shape[0])
+                matrix = np.empty((capacity, DIMENSION), dtype=LOCAL_SHORTLIST_DTYPE)
+                matrix[:self.count] = self._matrix[:self.count]
+                pks = np.empty(capacity, dtype=np.int64)
+                pks[:self.count] = self._ids[:self.count]
+                self._matrix, self._ids = matrix, pks
+            self._matrix[self.count:needed] = embeddings
+            self._ids[self.count:needed] = ids
+            self.count = needed
+            self.synced_rows += len(ids)
+    
+    def search(self, queries: np.ndarray, top_k: int):
+        """Exact inner-product top-K per query: one matmul plus an O(N) partition"""
+        with self._lock:
+            matrix, pks = self._matrix[:self.count], self._ids[:self.count]
+        scores = self._score(queries.astype(np.float32, copy=False), matrix)
+        k = min(top_k, matrix.shape[0])
+        results = []
+        for row in scores:
+            top = np.argpartition(row, -k)[-k:] if k < row.shape[0] else np.arange(row.shape[0])
+            top = top[np.argsort(row[top])[::-1]]
+            results.append((pks[top].tolist(), row[top]))
+        return results
+
+    @staticmethod
+    def _score(queries: np.ndarray, matrix: np.ndarray) -> np.ndarray:
+        """(nq, N) inner products; numpy has no fast float16 GEMM, so upcast cache-sized blocks"""
+        if matrix.dtype == np.float32:
+            return queries @ matrix.T
+        scores = np.empty((queries.shape[0], matrix.shape[0]), dtype=np.float32)
+        for start in range(0, matrix.shape[0], LOCAL_SCAN_BLOCK):
+            block = matrix[start:start + LOCAL_SCAN_BLOCK].astype(np.float32)
+            scores[:, start:start + LOCAL_SCAN_BLOCK] = queries @ block.T
+        return scores
+
+local_index = LocalEmbeddingIndex()
+face_metadata = OrderedDict()  # primary key -> {face_id, image_path, person_name}, LRU
+_face_metadata_lock = threading.Lock()
+
+def fetch_face_metadata(client, ids: list) -> dict:
+    """Metadata for ids, reading Milvus only for the ones not cached yet"""
+    with _face_metadata_lock:
+        cached = {pk: face_metadata[pk] for pk in ids if pk in face_metadata}
+        for pk in cached:
+            face_metadata.move_to_end(pk)
+    
+    missing = [pk for pk in ids if pk not in cached]
+    if missing:
+        rows = client.get(
+            collection_name=COLLECTION_NAME,
+            ids=missing,
+            output_fields=["face_id", "image_path", "person_name"]
+        )
+        with _face_metadata_lock:
+            for row in rows:
+                face_metadata[row["id"]] = row
+                cached[row["id"]] = row
+            while len(face_metadata) > METADATA_CACHE_SIZE:
+                face_metadata.popitem(last=False)
+    return cached
+
+def search_local(client, query_embeddings: list, top_k: int):
+    """Score against the local matrix, then fetch metadata for the winners only"""
+    # Other workers insert too: once Milvus reports rows we haven't mirrored, resync off the
+    # request path and serve from the current matrix meanwhile
+    if get_row_count() > local_index.synced_rows:
+        local_index.refresh_in_background()
+    
+    ranked = local_index.search(np.stack(query_embeddings), top_k + METADATA_PREFETCH)
+    by_id = fetch_face_metadata(client, list({pk for ids, _ in ranked for pk in ids}))
+    
+    return [
+        [SimpleNamespace(id=pk, score=float(score), entity=by_id[pk])
+         for pk, score in zip(ids[:top_k], scores[:top_k]) if pk in by_id]
+        for ids, scores in ranked
+    ]
+
+def insert_faces(client, rows: list) -> int:
+    """Insert face rows (and their binary codes when prefiltering), returning the inserted count"""
+    global _binary_synced_rows
+    result = client.insert(
+        collection_name=COLLECTION_NAME,
+        data=[{**row, "embedding": to_milvus_vector(row["embedding"])} for row in rows]
+    )
+    if LOCAL_SHORTLIST and local_index.ready:
+        local_index.add(list(result["ids"]), np.stack([row["embedding"] for row in rows]))
+    if BINARY_PREFILTER:
+        codes = binarize(np.stack([row["embedding"] for row in rows]))
+        client.insert(
+            collection_name=BIN_COLLECTION_NAME,
+            data=[{"id": pk, "bvec": code} for pk, code in zip(result["ids"], codes)]
+        )
+        _binary_synced_rows += len(rows)
+    return result.get("insert_count", len(rows))
+
+def insert_face_rows(rows: list) -> int:
+    """Insert rows through a pooled client in INSERT_BATCH_SIZE chunks; blocking, so run it off the event loop"""
+    inserted = 0
+    with milvus_pool.client() as client:
+        for start in range(0, len(rows), INSERT_BATCH_SIZE):
+            inserted += insert_faces(client, rows[start:start + INSERT_BATCH_SIZE])
+    increment_row_count(inserted)
+    return inserted
+
+def sample_faces(limit: int = 5) -> list:
+    """A few stored faces for /stats, through a pooled client; blocking, so run it off the event loop"""
+    with milvus_pool.client() as client:
+        return client.query(
+            collection_name=COLLECTION_NAME,
+            filter="",
+            output_fields=["face_id", "person_name"],
+            limit=limit
+        )
+
+def search_two_stage(client, query_embeddings: list, top_k: int):
+    """Hamming shortlist from the binary collection, then exact inner-product rerank of the shortlist"""
+    candidates = client.search(
+        collection_name=BIN_COLLECTION_NAME,
+        data=binarize(np.stack(query_embeddings)),
+        limit=top_k * BIN_CANDIDATE_FACTOR,
+        search_params={"metric_type": "HAMMING", "params": {"nprobe": int(os.getenv("IVF_NPROBE", 16))}}
+    )
+    candidate_ids = [[hit["id"] for hit in hits] for hits in candidates]
+    
+    # One fetch of the float vectors for every query's shortlist
+    unique_ids = list({pk for ids in candidate_ids for pk in ids})
+    rows = client.get(
+        collection_name=COLLECTION_NAME,
+        ids=unique_ids,
+        output_fields=["embedding", "face_id", "image_path", "person_name"]
+    ) if unique_ids else []
+    by_id = {row["id"]: row for row in rows}
+    
+    results = []
+    for query, ids in zip(query_embeddings, candidate_ids):
+        ids = [pk for pk in ids if pk in by_id]
+        if not ids:
+            results.append([])
+            continue
+        scores = np.stack([from_milvus_vector(by_id[pk]["embedding"]) for pk in ids]) @ query
+        order = np.argsort(scores)[::-1][:top_k]
+        results.append([
+            SimpleNamespace(id=ids[i], score=float(scores[i]), entity=by_id[ids[i]]) for i in order
+        ])
+    return results
+
+def build_search_params(top_k: int, ef: Optional[int] = None) -> dict:
+    params = dict(SEARCH_PARAMS[MILVUS_INDEX_TYPE])
+    if MILVUS_INDEX_TYPE == "HNSW":
+        params["ef"] = max(ef or EF_SEARCH, top_k)  # Milvus requires ef >= limit
+    elif MILVUS_INDEX_TYPE == "GPU_CAGRA":
+        params["itopk_size"] = max(ef or EF_SEARCH, top_k)  # CAGRA's search width, also >= limit
+    return {"metric_type": METRIC_TYPE, "params": params}
+
+def search_milvus(query_embeddings: list, top_k: int, ef: Optional[int] = None):
+    """Top-k hits per query; every path scores by cosine similarity (higher is closer) whatever the index metric"""
+    with milvus_pool.client() as client:
+        if LOCAL_SHORTLIST and local_index.ready:
+            return search_local(client, list(query_embeddings), top_k)
+        if BINARY_PREFILTER and _binary_ready:
+            if get_row_count() <= _binary_synced_rows:
+                return search_two_stage(client, list(query_embeddings), top_k)
+            # Faces added elsewhere have no codes yet: search the float collection until the backfill lands
+            sync_binary_codes_in_background()
+        results = client.search(
+            collection_name=COLLECTION_NAME,
+            data=[to_milvus_vector(q) for q in query_embeddings],  # ndarrays are packed straight to bytes
+            limit=top_k,
+            search_params=build_search_params(top_k, ef),
+            output_fields=["face_id", "image_path", "person_name"]
+        )
+    if METRIC_TYPE != "L2":
+        return results  # COSINE, or IP on unit-norm embeddings, is already the cosine similarity
+    # Milvus reports squared L2 distance; for unit vectors ||a - b||^2 = 2 - 2 cos(a, b)
+    return [
+        [SimpleNamespace(id=hit.id, score=1.0 - hit.score / 2.0, entity=hit.entity) for hit in hits]
+        for hits in results
+    ]
+
+def calibrate_ef(sample_size: int = 500, k: int = 5):
+    """Return (ef, recall@k) for the smallest EF_CANDIDATES entry matching a deep reference search"""
+    rows = milvus_client.query(
+        collection_name=COLLECTION_NAME,
+        filter="",
+        output_fields=["embedding"],
+        limit=sample_size
+    )
+    if len(rows) <= k:
+        return EF_SEARCH, None
+    queries = [to_milvus_vector(from_milvus_vector(row["embedding"])) for row in rows]
+    
+    def top_ids(ef: int):
+        hits = milvus_client.search(
+            collection_name=COLLECTION_NAME,
+            data=queries,
+            limit=k,
+            search_params={"metric_type": METRIC_TYPE, "params": {"ef": ef}}
+        )
+        return [{hit["id"] for hit in query_hits} for query_hits in hits]
+    
+    # A very deep HNSW search stands in for exact ground truth
+    reference = top_ids(2 * max(EF_CANDIDATES))
+    for ef in EF_CANDIDATES:
+        recall = float(np.mean([len(found & truth) / len(truth) for found, truth in zip(top_ids(ef), reference)]))
+        if recall >= TARGET_RECALL:
+            return ef, recall
+    return max(EF_CANDIDATES), recall
+
+class SearchBatcher:
+    """Coalesce concurrent queries into a single multi-vector Milvus search"""
+    
+    def __init__(self, max_batch: int = 16, window_ms: float = 5.0):
+        self.max_batch = max_batch
+        self.window = window_ms / 1000.0
+        self._queue = None
+        self._task = None
+    
+    def start(self):
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+    
+    async def submit(self, query_embedding: np.ndarray, top_k: int, ef: Optional[int] = None):
+        """Queue one query and wait for its hits"""
+        if self._task is None:
+            return (await run_in_threadpool(search_milvus, [query_embedding], top_k, ef))[0]
+        
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((query_embedding, top_k, ef or EF_SEARCH, future))
+        return await future
+    
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            
+            # Keep collecting until the batch is full or the window closes
+            deadline = loop.time() + self.window
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            
+            # Search with the largest top_k and ef in the batch, then trim per caller
+            max_k = max(top_k for _, top_k, _, _ in batch)
+            max_ef = max(ef for _, _, ef, _ in batch)
+            try:
+                results = await run_in_threadpool(
+                    search_milvus, [embedding for embedding, _, _, _ in batch], max_k, max_ef
+                )
+            except Exception as e:
+                for _, _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            
+            for (_, top_k, _, future), hits in zip(batch, results):
+                if not future.done():
+                    future.set_result(list(hits)[:top_k])
+
+search_batcher = SearchBatcher(
+    max_batch=int(os.getenv("SEARCH_BATCH_MAX", 16)),
+    window_ms=float(os.getenv("SEARCH_BATCH_WINDOW_MS", 5))
+)
+
 @app.get("/")
 async def root():
     try:
-        stats = milvus_client.get_collection_stats(COLLECTION_NAME)
         return {
             "message": "🎯 Halo Face Search API is running!",
             "status": "healthy",
             "version": "1.0.0",
-            "database_faces": stats.get('row_count', 0),
+            "database_faces": await run_in_threadpool(get_row_count),
             "capabilities": {
                 "face_recognition": "ArcFace 512D embeddings",
                 "vector_database": "Milvus with HNSW indexing",
@@ -140,6 +1006,7 @@ async def root():
             "endpoints": {
                 "/search": "POST - Search for similar faces",
                 "/add_face": "POST - Add new face to database",
+                "/add_faces_batch": "POST - Add many faces in one request",
                 "/stats": "GET - Database statistics", 
                 "/docs": "GET - API documentation"
             }
@@ -150,34 +1017,36 @@ async def root():
 @app.get("/health")
 async def health_check():
     try:
-        stats = milvus_client.get_collection_stats(COLLECTION_NAME)
+        # The health probe is the one place that still talks to Milvus, which also resyncs the counter
         return {
             "status": "healthy",
             "services": {"milvus_connected": True, "api_server": "running"},
-            "database": {"total_faces": stats.get('row_count', 0), "embedding_dimension": DIMENSION}
+            "database": {"total_faces": await run_in_threadpool(refresh_row_count), "embedding_dimension": DIMENSION}
         }
     except Exception as e:
         return JSONResponse(status_code=503, content={"status": "unhealthy", "error": str(e)})
 
 @app.post("/search") 
-async def search_faces(file: UploadFile = File(...), top_k: int = 5):
+async def search_faces(file: UploadFile = File(...), top_k: int = 5, ef: Optional[int] = None):
     if not file.content_type or not file.content_type.startswith('image/'):
         raise HTTPException(status_code=400, detail="File must be an image")
     
-    with tempfile.NamedTemporaryFile(delete=False, suffix='.jpg') as tmp_file:
-        content = await file.read()
-        tmp_file.write(content)
-        tmp_file_path = tmp_file.name
+    if ef is not None and not top_k <= ef <= MAX_EF:
+        raise HTTPException(status_code=400, detail=f"ef must be between top_k ({top_k}) and {MAX_EF}")
+    
+    content = await file.read()
     
     try:
-        query_embedding = extract_face_embedding(tmp_file_path)
+        # Identical uploads skip decode + DeepFace entirely
+        cache_key = EmbeddingCache.key_for(content)
+        query_embedding = embedding_cache.get(cache_key)
+        if query_embedding is None:
+            # Concurrent uploads share one ArcFace forward pass
+            query_embedding = await embed_image_bytes(content)
+            embedding_cache.put(cache_key, query_embedding)
         
-        search_results = milvus_client.search(
-            collection_name=COLLECTION_NAME,
-            data=[query_embedding.tolist()],
-            limit=top_k,
-            output_fields=["face_id", "image_path", "person_name"]
-        )
+        # Concurrent queries are packed into one nq>1 Milvus search
+        search_results = [await search_batcher.submit(query_embedding, top_k, ef)]
         
         results = []
         if search_results and len(search_results[0]) > 0:
@@ -189,78 +1058,109 @@ async def search_faces(file: UploadFile = File(...), top_k: int = 5):
                     "similarity_score": round(float(hit.score), 4)
                 })
         
-        return {
+        # Return the response directly to skip jsonable_encoder on the hot path
+        return ORJSONResponse(content={
             "success": True,
             "message": "Face search completed",
             "query": {"filename": file.filename, "results_found": len(results)},
             "results": results
-        }
+        })
         
     except Exception as e:
         print(f"❌ Search error: {e}")  # Debug logging
         raise HTTPException(status_code=500, detail=f"Face search failed: {str(e)}")
-        
-    finally:
-        if os.path.exists(tmp_file_path):
-            os.unlink(tmp_file_path)
 
 @app.post("/add_face")
 async def add_face(file: UploadFile = File(...), person_name: str = None):
     if not file.content_type or not file.content_type.startswith('image/'):
         raise HTTPException(status_code=400, detail="File must be an image")
     
-    current_count = milvus_client.get_collection_stats(COLLECTION_NAME).get('row_count', 0)
+    # Pool waits and Milvus RPCs block, so they run on the threadpool, never on the event loop
+    current_count = await run_in_threadpool(get_row_count)
     face_id = f"face_{current_count + 1:06d}"
     
-    with tempfile.NamedTemporaryFile(delete=False, suffix='.jpg') as tmp_file:
-        content = await file.read()
-        tmp_file.write(content)
-        tmp_file_path = tmp_file.name
+    content = await file.read()
+    embedding = await embed_image_bytes(content)
     
-    try:
-        embedding = extract_face_embedding(tmp_file_path)
-        
-        data = [{
-            "face_id": face_id,
-            "embedding": embedding.tolist(),
+    data = [{
+        "face_id": face_id,
+        "embedding": embedding,
+        "image_path": f"uploaded/{file.filename}",
+        "person_name": person_name or "Unknown"
+    }]
+    
+    await run_in_threadpool(insert_face_rows, data)
+    
+    return {
+        "success": True,
+        "message": "Face added successfully",
+        "face_id": face_id,
+        "person_name": person_name or "Unknown"
+    }
+
+@app.post("/add_faces_batch")
+async def add_faces_batch(files: List[UploadFile] = File(...), person_name: str = None):
+    for file in files:
+        if not file.content_type or not file.content_type.startswith('image/'):
+            raise HTTPException(status_code=400, detail=f"File must be an image: {file.filename}")
+    
+    contents = [await file.read() for file in files]
+    
+    # All uploads go through the embedding batcher together, so they share forward passes
+    embeddings = await asyncio.gather(
+        *(embed_image_bytes(content) for content in contents), return_exceptions=True
+    )
+    
+    current_count = await run_in_threadpool(get_row_count)
+    data, failed = [], []
+    for file, embedding in zip(files, embeddings):
+        if isinstance(embedding, Exception):
+            failed.append({"filename": file.filename, "error": getattr(embedding, "detail", str(embedding))})
+            continue
+        data.append({
+            "face_id": f"face_{current_count + len(data) + 1:06d}",
+            "embedding": embedding,
             "image_path": f"uploaded/{file.filename}",
             "person_name": person_name or "Unknown"
-        }]
-        
-        result = milvus_client.insert(collection_name=COLLECTION_NAME, data=data)
-        
-        return {
-            "success": True,
-            "message": "Face added successfully",
-            "face_id": face_id,
-            "person_name": person_name or "Unknown"
-        }
-        
-    finally:
-        if os.path.exists(tmp_file_path):
-            os.unlink(tmp_file_path)
+        })
+    
+    inserted = await run_in_threadpool(insert_face_rows, data)
+    
+    return {
+        "success": True,
+        "message": f"Added {inserted} of {len(files)} faces",
+        "face_ids": [row["face_id"] for row in data],
+        "failed": failed
+    }
 
 @app.get("/stats")
 async def get_stats():
     try:
-        stats = milvus_client.get_collection_stats(COLLECTION_NAME)
-        sample_records = milvus_client.query(
-            collection_name=COLLECTION_NAME,
-            filter="",
-            output_fields=["face_id", "person_name"],
-            limit=5
-        )
+        sample_records = await run_in_threadpool(sample_faces)
         
         return {
             "database_stats": {
-                "total_faces": stats.get('row_count', 0),
-                "embedding_dimension": DIMENSION
+                "total_faces": await run_in_threadpool(get_row_count),
+                "embedding_dimension": DIMENSION,
+                "index_type": MILVUS_INDEX_TYPE
             },
             "sample_faces": sample_records,
+            "embedding_cache": embedding_cache.get_stats(),
             "api_info": {"version": "1.0.0", "face_model": "ArcFace"}
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # State lives in Milvus, so extra workers are safe; set WORKERS to scale out.
+    # Workers need an import string, so put the project root on the path for `python app/main.py`
+    if WORKERS > 1:
+        sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    uvicorn.run(
+        "app.main:app" if WORKERS > 1 else app,
+        host="0.0.0.0",
+        port=8000,
+        workers=WORKERS,
+        loop="uvloop",
+        http="httptools"
+    )
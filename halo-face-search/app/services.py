@@ -1,9 +1,13 @@
 # file: app/services.py
 import os
 import sys
+import hashlib
+from collections import OrderedDict
+from functools import lru_cache
 from typing import List, Dict, Optional
 from pymilvus import Collection
 import numpy as np
+import cv2
 
 # Add scripts directory to path to access our modules
 sys.path.append(os.path.join(os.path.dirname(os.path.dirname(__file__)), 'scripts'))
@@ -12,6 +16,9 @@ from milvus_manager import (
     connect_to_milvus, 
     create_milvus_collection, 
     search_similar_faces,
+    ensure_collection_loaded,
+    release_collection,
+    SEARCH_PARAMS,
     MILVUS_HOST,
     MILVUS_PORT
 )
@@ -21,6 +28,9 @@ class FaceSearchService:
     
     def __init__(self):
         self.collection: Optional[Collection] = None
+        # Query embeddings keyed by a hash of the image bytes (LRU)
+        self._embedding_cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._embedding_cache_size = int(os.getenv('EMBEDDING_CACHE_SIZE', 1024))
         self._connect_to_milvus()
     
     def _connect_to_milvus(self):
@@ -35,7 +45,7 @@ class FaceSearchService:
             
             # Load collection into memory for searching
             if self.collection.num_entities > 0:
-                self.collection.load()
+                ensure_collection_loaded(self.collection)
                 print(f"Loaded collection with {self.collection.num_entities} faces.")
             else:
                 print("Warning: Collection is empty. Please run data ingestion first.")
@@ -55,7 +65,7 @@ class FaceSearchService:
             List of dictionaries containing similar faces
         """
         # Generate embedding for the query image
-        query_embedding = get_face_embedding(image_path)
+        query_embedding = self._get_query_embedding(image_path)
         
         if query_embedding is None:
             return []
@@ -65,27 +75,46 @@ class FaceSearchService:
         
         # Search for similar faces
         try:
+            ensure_collection_loaded(self.collection)  # no-op once loaded; never released per query
             results = search_similar_faces(
                 self.collection, 
-                query_embedding.tolist(), 
-                top_k=top_k
+                query_embedding,  # float32 ndarray, no per-query list conversion
+                top_k=top_k,
+                search_params=SEARCH_PARAMS
             )
             return results
         except Exception as e:
             print(f"Error during search: {e}")
             return []
     
+    def _get_query_embedding(self, image_path: str) -> Optional[np.ndarray]:
+        """Return the cached embedding for identical image bytes, computing it on a miss."""
+        with open(image_path, 'rb') as f:
+            content = f.read()
+        key = hashlib.blake2b(content, digest_size=16).hexdigest()
+        
+        embedding = self._embedding_cache.get(key)
+        if embedding is not None:
+            self._embedding_cache.move_to_end(key)
+            return embedding
+        
+        # Decode the bytes already in memory instead of letting DeepFace reopen the file
+        img = cv2.imdecode(np.frombuffer(content, np.uint8), cv2.IMREAD_COLOR)
+        embedding = get_face_embedding(img if img is not None else image_path)
+        if embedding is not None:
+            self._embedding_cache[key] = embedding
+            if len(self._embedding_cache) > self._embedding_cache_size:
+                self._embedding_cache.popitem(last=False)
+        return embedding
+    
     def close(self):
         """Release resources."""
         if self.collection is not None:
-            self.collection.release()
-
-# Singleton instance
-_face_search_service: Optional[FaceSearchService] = None
+            release_collection(self.collection)
 
+# Singleton instance: one connection and one loaded collection per process.
+# The pymilvus connection is not fork-safe, so create it after workers start.
+@lru_cache(maxsize=1)
 def get_face_search_service() -> FaceSearchService:
     """Get or create the face search service instance."""
-    global _face_search_service
-    if _face_search_service is None:
-        _face_search_service = FaceSearchService()
-    return _face_search_service 
\ No newline at end of file
+    return FaceSearchService() 
\ No newline at end of file
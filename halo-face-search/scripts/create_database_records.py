@@ -3,21 +3,45 @@ import os
 import sys
 import uuid
 import json
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
 
 # Add the scripts directory to Python path to import embedding_generator
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-from embedding_generator import get_face_embedding
+from embedding_generator import get_face_embedding, l2_normalize_rows, MODEL_NAME
+
+BATCH_SIZE = 64  # images handed to a worker per task
+
+def _init_worker():
+    """Load ArcFace once per worker process instead of on the first image of every batch."""
+    from deepface import DeepFace
+    DeepFace.build_model(MODEL_NAME)
+
+def _embed_batch(image_paths: list) -> list:
+    """Embed a batch of images inside a worker; None marks images with no detected face."""
+    embeddings = [get_face_embedding(path, normalize=False) for path in image_paths]
+    
+    # Normalize the whole batch in one contiguous pass instead of once per face
+    found = [k for k, embedding in enumerate(embeddings) if embedding is not None]
+    if found:
+        normalized = l2_normalize_rows(np.stack([embeddings[k] for k in found]))
+        for k, embedding in zip(found, normalized):
+            embeddings[k] = embedding
+    return embeddings
 
 def process_image_directory(image_dir: str, output_file: str):
     """
     Processes all images in a directory to generate face embeddings and saves them
-    as a structured JSON file.
+    as a JSON file of record metadata plus a float32 .npy matrix of embeddings
+    (row i belongs to record i).
 
     Args:
         image_dir (str): Directory containing the face images.
         output_file (str): Path to save the JSON file with database records.
     """
     database_records = []
+    embeddings_out = []
     
     if not os.path.exists(image_dir):
         print(f"Error: Image directory '{image_dir}' does not exist.")
@@ -28,29 +52,39 @@ def process_image_directory(image_dir: str, output_file: str):
     total_files = len(image_files)
     print(f"Found {total_files} images to process in '{image_dir}'.")
 
-    for i, filename in enumerate(image_files):
-        image_path = os.path.join(image_dir, filename)
-        
-        # Generate the embedding for the current face
-        embedding = get_face_embedding(image_path)
-        
-        if embedding is not None:
-            record = {
-                'id': str(uuid.uuid4()),  # Generate a unique ID for each record
-                'image_path': image_path,
-                'embedding': embedding.tolist()  # Convert numpy array to list for JSON serialization
-            }
-            database_records.append(record)
-            print(f"Processed {i+1}/{total_files}: {filename}")
-        else:
-            print(f"Skipped {i+1}/{total_files}: {filename} (no face detected or error)")
+    image_paths = [os.path.join(image_dir, filename) for filename in image_files]
+    batches = [image_paths[start:start + BATCH_SIZE] for start in range(0, total_files, BATCH_SIZE)]
+    
+    # Embed batches in parallel, one ArcFace instance per core; map() keeps file order.
+    # Workers are spawned, not forked, so none inherits this process's deepface/TensorFlow state
+    i = 0
+    with ProcessPoolExecutor(max_workers=os.cpu_count(), initializer=_init_worker,
+                             mp_context=get_context('spawn')) as executor:
+        for batch_paths, embeddings in zip(batches, executor.map(_embed_batch, batches)):
+            for image_path, embedding in zip(batch_paths, embeddings):
+                i += 1
+                filename = os.path.basename(image_path)
+                
+                if embedding is not None:
+                    record = {
+                        'id': str(uuid.uuid4()),  # Generate a unique ID for each record
+                        'image_path': image_path
+                    }
+                    database_records.append(record)
+                    embeddings_out.append(embedding)
+                    print(f"Processed {i}/{total_files}: {filename}")
+                else:
+                    print(f"Skipped {i}/{total_files}: {filename} (no face detected or error)")
             
-    # Save the records to a JSON file
+    # Save the embeddings as raw float32 (.npy) and only the small metadata as JSON
     os.makedirs(os.path.dirname(output_file), exist_ok=True)
+    embeddings_file = os.path.splitext(output_file)[0] + '.npy'
+    np.save(embeddings_file, np.asarray(embeddings_out, dtype=np.float32).reshape(-1, 512))
     with open(output_file, 'w') as f:
         json.dump(database_records, f, indent=4)
         
-    print(f"\nProcessing complete. Saved {len(database_records)} records to '{output_file}'.")
+    print(f"\nProcessing complete. Saved {len(database_records)} records to '{output_file}' "
+          f"and their embeddings to '{embeddings_file}'.")
 
 if __name__ == '__main__':
     IMAGE_DIRECTORY = 'data/synthetic_faces'
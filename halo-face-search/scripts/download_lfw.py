@@ -7,9 +7,18 @@ Real face data to supplement synthetic faces for better recognition
 import os
 import numpy as np
 import cv2
+from concurrent.futures import ThreadPoolExecutor
 from sklearn.datasets import fetch_lfw_people
 import shutil
 
+def count_synthetic_faces(data_dir):
+    """Number of files in data_dir/synthetic_faces, 0 if it does not exist"""
+    synthetic_dir = os.path.join(data_dir, 'synthetic_faces')
+    if not os.path.isdir(synthetic_dir):
+        return 0
+    with os.scandir(synthetic_dir) as entries:
+        return sum(1 for entry in entries if entry.is_file())
+
 def download_lfw():
     """Download LFW dataset using scikit-learn's built-in fetcher"""
     
@@ -38,28 +47,26 @@ def download_lfw():
         
         print(f"✅ Downloaded {len(lfw_dataset.images)} images of {len(lfw_dataset.target_names)} people")
         
-        # Convert and save images
+        # Convert the whole stack from sklearn format (0-1 float) to standard images (0-255 uint8) at once
+        images_uint8 = (lfw_dataset.images * 255).astype(np.uint8)
+        
+        # Clean person names for filenames
+        clean_names = [name.replace(' ', '_').replace('.', '') for name in lfw_dataset.target_names]
+        filepaths = [
+            os.path.join(lfw_faces_dir, f"{clean_names[target]}_{i:04d}.jpg")
+            for i, target in enumerate(lfw_dataset.target)
+        ]
+        
+        # JPEG encoding + writes release the GIL, so threads overlap them
         face_count = 0
-        for i, (image, target) in enumerate(zip(lfw_dataset.images, lfw_dataset.target)):
-            person_name = lfw_dataset.target_names[target]
-            # Clean person name for filename
-            clean_name = person_name.replace(' ', '_').replace('.', '')
-            filename = f"{clean_name}_{i:04d}.jpg"
-            filepath = os.path.join(lfw_faces_dir, filename)
-            
-            # Convert from sklearn format (0-1 float) to standard image (0-255 uint8)
-            image_uint8 = (image * 255).astype(np.uint8)
-            
-            # Save image
-            cv2.imwrite(filepath, image_uint8)
-            face_count += 1
-            
-            if face_count % 100 == 0:
-                print(f"📁 Saved {face_count} faces...")
+        with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+            for _ in executor.map(cv2.imwrite, filepaths, images_uint8):
+                face_count += 1
+                if face_count % 100 == 0:
+                    print(f"📁 Saved {face_count} faces...")
         
         # Summary
-        synthetic_dir = os.path.join(data_dir, 'synthetic_faces')
-        synthetic_count = len(os.listdir(synthetic_dir)) if os.path.exists(synthetic_dir) else 0
+        synthetic_count = count_synthetic_faces(data_dir)
         
         print(f"\n🎉 LFW dataset successfully organized!")
         print(f"📊 LFW faces: {face_count} real faces from {len(lfw_dataset.target_names)} people")
@@ -87,8 +94,7 @@ def download_lfw():
         print(f"\n❌ Error downloading LFW dataset: {e}")
         print("💡 Will continue with synthetic faces only")
         
-        synthetic_dir = os.path.join(data_dir, 'synthetic_faces')
-        synthetic_count = len(os.listdir(synthetic_dir)) if os.path.exists(synthetic_dir) else 0
+        synthetic_count = count_synthetic_faces(data_dir)
         
         return {
             'success': False,
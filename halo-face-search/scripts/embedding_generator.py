@@ -6,16 +6,29 @@ import numpy as np
 # DeepFace will automatically download the model weights on the first run.
 MODEL_NAME = "ArcFace"
 
-def get_face_embedding(image_path: str) -> np.ndarray | None:
+def l2_normalize_rows(embeddings: np.ndarray) -> np.ndarray:
+    """
+    L2-normalizes every row of a (B, 512) float32 matrix in place with one fused
+    reduction (einsum for the squared norms, then a single broadcast multiply).
+    """
+    norms = np.sqrt(np.einsum('ij,ij->i', embeddings, embeddings))
+    embeddings *= np.reciprocal(np.maximum(norms, 1e-12))[:, None]
+    return embeddings
+
+def get_face_embedding(image_path: str | np.ndarray, normalize: bool = True) -> np.ndarray | None:
     """
     Generates a 512-dimensional facial embedding for a given image using ArcFace.
 
     Args:
-        image_path (str): The path to the image file.
+        image_path (str | np.ndarray): The path to the image file, or an already
+                                       decoded BGR image array.
+        normalize (bool): L2-normalize the result. Batch callers pass False and
+                          normalize all rows at once with l2_normalize_rows.
 
     Returns:
-        np.ndarray | None: A 512-dimensional numpy array representing the face embedding,
-                           or None if no face is detected.
+        np.ndarray | None: A 512-dimensional float32 array (L2-normalized unless
+                           normalize=False) representing the face embedding, or None
+                           if no face is detected.
     """
     try:
         # The represent function handles face detection, alignment, and embedding generation.
@@ -27,11 +40,15 @@ def get_face_embedding(image_path: str) -> np.ndarray | None:
         )
         
         # We assume one face per image as per the project spec.
-        embedding = embedding_objs[0]['embedding']
-        return np.array(embedding)
+        # Normalize once here (float32, in place) so every consumer can score with a plain dot product.
+        embedding = np.asarray(embedding_objs[0]['embedding'], dtype=np.float32)
+        if normalize:
+            embedding *= 1.0 / np.sqrt(np.dot(embedding, embedding))
+        return embedding
     except ValueError as e:
         # This error is typically raised by deepface if no face is detected.
-        print(f"Error processing image {image_path}: {e}")
+        source = image_path if isinstance(image_path, str) else "<array>"
+        print(f"Error processing image {source}: {e}")
         return None
 
 if __name__ == '__main__':
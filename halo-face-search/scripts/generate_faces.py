@@ -1,16 +1,27 @@
 # file: generate_faces.py
 import os
-import requests
+import asyncio
+import aiofiles
+import httpx
 import zipfile
 from PIL import Image
 import numpy as np
 import torch
 from torchvision.utils import save_image
 
-def download_synthetic_faces(num_faces: int, output_dir: str):
+FACE_URL = "https://thispersondoesnotexist.com/"
+MAX_CONCURRENT_DOWNLOADS = 32  # keep the load on the remote service polite
+
+# Placeholder face geometry is index-independent, so the oval mask is built once at import
+PLACEHOLDER_SIZE = 256
+_yy, _xx = np.ogrid[:PLACEHOLDER_SIZE, :PLACEHOLDER_SIZE]
+OVAL_MASK = ((_xx - PLACEHOLDER_SIZE // 2) / 100.0)**2 + ((_yy - PLACEHOLDER_SIZE // 2) / 120.0)**2 < 1
+
+async def download_synthetic_faces(num_faces: int, output_dir: str):
     """
     Downloads synthetic faces from This Person Does Not Exist API or similar.
     For production, we'd use StyleGAN, but this is faster for the demo.
+    Downloads run concurrently so request latency overlaps instead of adding up.
     """
     print(f"Creating directory: {output_dir}")
     os.makedirs(output_dir, exist_ok=True)
@@ -18,53 +29,50 @@ def download_synthetic_faces(num_faces: int, output_dir: str):
     # Alternative: Use pre-generated synthetic faces
     print(f"Generating {num_faces} synthetic faces...")
     
-    for i in range(num_faces):
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_DOWNLOADS)
+    limits = httpx.Limits(max_connections=MAX_CONCURRENT_DOWNLOADS)
+    async with httpx.AsyncClient(limits=limits, timeout=10) as client:
+        await asyncio.gather(*(
+            download_one_face(client, semaphore, i, num_faces, output_dir) for i in range(num_faces)
+        ))
+            
+    print(f"Successfully generated {num_faces} faces in '{output_dir}'.")
+
+async def download_one_face(client: httpx.AsyncClient, semaphore: asyncio.Semaphore,
+                            index: int, num_faces: int, output_dir: str):
+    """Download a single face, falling back to a placeholder on any failure."""
+    async with semaphore:
         try:
             # Option 1: Download from thispersondoesnotexist.com (if available)
             # Note: In production, we'd generate these ourselves with StyleGAN
-            response = requests.get("https://thispersondoesnotexist.com/", stream=True)
+            response = await client.get(FACE_URL)
             if response.status_code == 200:
-                file_path = os.path.join(output_dir, f'face_{i:04d}.jpg')
-                with open(file_path, 'wb') as f:
-                    for chunk in response.iter_content(1024):
-                        f.write(chunk)
-                print(f"Downloaded face {i+1}/{num_faces}")
+                file_path = os.path.join(output_dir, f'face_{index:04d}.jpg')
+                async with aiofiles.open(file_path, 'wb') as f:
+                    await f.write(response.content)
+                print(f"Downloaded face {index+1}/{num_faces}")
             else:
                 # Fallback: Generate a placeholder face
-                generate_placeholder_face(i, output_dir)
+                generate_placeholder_face(index, output_dir)
         except Exception as e:
-            print(f"Error downloading face {i}: {e}")
+            print(f"Error downloading face {index}: {e}")
             # Generate placeholder instead
-            generate_placeholder_face(i, output_dir)
-            
-    print(f"Successfully generated {num_faces} faces in '{output_dir}'.")
+            generate_placeholder_face(index, output_dir)
 
 def generate_placeholder_face(index: int, output_dir: str):
     """
     Generates a placeholder face image for testing purposes.
     In production, this would use StyleGAN.
     """
-    # Create a simple synthetic face-like image
-    img_size = 256
-    img_array = np.zeros((img_size, img_size, 3), dtype=np.uint8)
-    
     # Add some variation based on index
     np.random.seed(index)
     
-    # Simple face structure
-    # Background
+    # Simple face structure: background and face oval colors
     bg_color = np.random.randint(200, 255, 3)
-    img_array[:, :] = bg_color
-    
-    # Face oval
-    center_x, center_y = img_size // 2, img_size // 2
     face_color = np.random.randint(150, 220, 3)
     
-    for y in range(img_size):
-        for x in range(img_size):
-            # Simple oval equation
-            if ((x - center_x) / 100)**2 + ((y - center_y) / 120)**2 < 1:
-                img_array[y, x] = face_color
+    # Write every pixel exactly once from the precomputed oval mask
+    img_array = np.where(OVAL_MASK[..., None], face_color, bg_color).astype(np.uint8)
     
     # Save image
     img = Image.fromarray(img_array)
@@ -79,7 +87,7 @@ def generate_synthetic_faces_stylegan(num_faces: int, output_dir: str):
     print("Note: StyleGAN generation requires significant setup and GPU resources.")
     print("For this demo, using download_synthetic_faces() instead.")
     # In production, implement full StyleGAN generation here
-    download_synthetic_faces(num_faces, output_dir)
+    asyncio.run(download_synthetic_faces(num_faces, output_dir))
 
 if __name__ == '__main__':
     NUM_FACES_TO_GENERATE = 1000
@@ -87,4 +95,4 @@ if __name__ == '__main__':
     
     # For demo purposes, we'll download/generate faces
     # In production, use generate_synthetic_faces_stylegan()
-    download_synthetic_faces(NUM_FACES_TO_GENERATE, OUTPUT_IMAGE_DIR) 
\ No newline at end of file
+    asyncio.run(download_synthetic_faces(NUM_FACES_TO_GENERATE, OUTPUT_IMAGE_DIR)) 
\ No newline at end of file
@@ -7,37 +7,200 @@ Load both synthetic and LFW faces into Milvus vector database
 import os
 import sys
 import glob
+import hashlib
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import islice
+from multiprocessing import get_context
 from pathlib import Path
 import numpy as np
+import cv2
 from pymilvus import MilvusClient
 from deepface import DeepFace
+from deepface.detectors import FaceDetector
 import warnings
 
+try:
+    from turbojpeg import TurboJPEG, TJPF_BGR
+except ImportError:
+    TurboJPEG = None
+
+try:
+    import onnxruntime as ort
+except ImportError:
+    ort = None
+
 warnings.filterwarnings("ignore")
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
 
 # Add parent directory to path for imports
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-def extract_face_embedding(image_path: str) -> np.ndarray:
-    """Extract face embedding using DeepFace ArcFace model"""
-    try:
-        embedding_obj = DeepFace.represent(
-            img_path=image_path,
-            model_name="ArcFace",
-            detector_backend="opencv",
-            enforce_detection=False,
-            align=True,
-            normalization="base"
+# Same index choice as the API (app/main.py): HNSW on CPU, GPU_CAGRA on GPU-enabled Milvus
+MILVUS_INDEX_TYPE = os.getenv("MILVUS_INDEX_TYPE", "HNSW").upper()
+INDEX_BUILD_PARAMS = {
+    "HNSW": {"M": 16, "efConstruction": 200},
+    "IVF_SQ8": {"nlist": int(os.getenv("IVF_NLIST", 128))},
+    "GPU_CAGRA": {"intermediate_graph_degree": 64, "graph_degree": 32},
+}
+
+# fp16 vectors halve Milvus memory and bandwidth; must match what the API expects (MILVUS_VECTOR_TYPE)
+MILVUS_VECTOR_TYPE = os.getenv("MILVUS_VECTOR_TYPE", "FLOAT16_VECTOR").upper()
+VECTOR_DTYPE = np.float16 if MILVUS_VECTOR_TYPE == "FLOAT16_VECTOR" else np.float32
+
+# ArcFace expects 112x112 aligned crops; embed this many per forward pass
+ARCFACE_INPUT_SIZE = (112, 112)
+EMBEDDING_BATCH_SIZE = 32
+# Crops the alignment workers may run ahead of inference; bounds memory if the model is the bottleneck
+PREPROCESS_AHEAD = 4 * EMBEDDING_BATCH_SIZE
+_arcface_model = None
+_turbo_jpeg = None
+_face_detector = None
+
+# int8 ArcFace from scripts/export_arcface_onnx.py; cosine on unit-norm embeddings tolerates the quantization noise
+ARCFACE_INT8_ONNX_PATH = os.getenv("ARCFACE_INT8_ONNX_PATH", "models/arcface_int8.onnx")
+_onnx_session = None
+
+def get_turbo_jpeg():
+    """Create the TurboJPEG decoder once; None if PyTurboJPEG or the libturbojpeg library is missing"""
+    global _turbo_jpeg, TurboJPEG
+    if _turbo_jpeg is None and TurboJPEG is not None:
+        try:
+            _turbo_jpeg = TurboJPEG()
+        except (OSError, RuntimeError) as e:
+            # The Python package is installed but the shared library isn't: decode with OpenCV
+            print(f"⚠️  libturbojpeg unavailable, decoding with OpenCV: {e}")
+            TurboJPEG = None
+    return _turbo_jpeg
+
+def decode_image(image_path: str) -> np.ndarray:
+    """Decode to a BGR array, using libjpeg-turbo's SIMD decoder for JPEGs when available"""
+    with open(image_path, 'rb') as f:
+        buf = f.read()
+    
+    turbo_jpeg = get_turbo_jpeg() if buf[:2] == b'\xff\xd8' else None
+    if turbo_jpeg is not None:
+        return turbo_jpeg.decode(buf, pixel_format=TJPF_BGR)
+    
+    img = cv2.imdecode(np.frombuffer(buf, np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        raise ValueError("could not decode image")
+    return img
+
+def get_arcface_model():
+    """Build the ArcFace model once and reuse it for batched inference"""
+    global _arcface_model
+    if _arcface_model is None:
+        _arcface_model = DeepFace.build_model("ArcFace")  # a Keras Model on deepface 0.0.79
+    return _arcface_model
+
+def get_onnx_session():
+    """Create the int8 ArcFace ONNX Runtime session once, if onnxruntime and the model exist"""
+    global _onnx_session
+    if _onnx_session is None and ort is not None and os.path.exists(ARCFACE_INT8_ONNX_PATH):
+        sess_options = ort.SessionOptions()
+        sess_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        sess_options.intra_op_num_threads = os.cpu_count()
+        available = ort.get_available_providers()
+        providers = [p for p in ("CUDAExecutionProvider", "CPUExecutionProvider") if p in available]
+        _onnx_session = ort.InferenceSession(
+            ARCFACE_INT8_ONNX_PATH,
+            sess_options=sess_options,
+            providers=providers
         )
-        
-        embedding = np.array(embedding_obj[0]["embedding"])
-        return embedding / np.linalg.norm(embedding)  # Normalize for cosine similarity
+    return _onnx_session
+
+def get_face_detector():
+    """Build the OpenCV face detector once per process instead of resolving it through DeepFace per image"""
+    global _face_detector
+    if _face_detector is None:
+        _face_detector = FaceDetector.build_model("opencv")
+    return _face_detector
+
+def align_face(img: np.ndarray) -> np.ndarray:
+    """Detect, align and letterbox the first face to 112x112 BGR in [0, 1], as DeepFace.extract_faces does"""
+    face_objs = FaceDetector.detect_faces(get_face_detector(), "opencv", img, True)
+    face = face_objs[0][0] if face_objs and face_objs[0][0].size else img  # enforce_detection=False
+    
+    # Scale the longer side to 112 and zero-pad the shorter one, keeping the aspect ratio
+    factor = min(ARCFACE_INPUT_SIZE[0] / face.shape[0], ARCFACE_INPUT_SIZE[1] / face.shape[1])
+    face = cv2.resize(face, (int(face.shape[1] * factor), int(face.shape[0] * factor)))
+    diff_0 = ARCFACE_INPUT_SIZE[0] - face.shape[0]
+    diff_1 = ARCFACE_INPUT_SIZE[1] - face.shape[1]
+    face = np.pad(face, ((diff_0 // 2, diff_0 - diff_0 // 2), (diff_1 // 2, diff_1 - diff_1 // 2), (0, 0)), "constant")
+    if face.shape[:2] != ARCFACE_INPUT_SIZE:
+        face = cv2.resize(face, ARCFACE_INPUT_SIZE)
+    
+    return face.astype(np.float32) / 255
+
+def preprocess_face(image_path) -> np.ndarray:
+    """Detect and align a face, returning a (112, 112, 3) crop ready for ArcFace"""
+    try:
+        img = decode_image(image_path) if isinstance(image_path, str) else image_path
+        # Stays BGR end to end, the layout ArcFace was fed by represent(); no RGB round trip
+        return align_face(img)
         
     except Exception as e:
         print(f"⚠️ Failed to process {image_path}: {e}")
         return None
 
+def file_digest(path) -> bytes:
+    """SHA-256 of a file's bytes (OpenSSL uses the CPU's SHA extensions where available)"""
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).digest()
+
+def prefetch_files(paths: list):
+    """Queue asynchronous kernel readahead for every file so workers' reads hit the page cache"""
+    if not hasattr(os, "posix_fadvise"):
+        return
+    for path in paths:
+        try:
+            fd = os.open(path, os.O_RDONLY)
+            try:
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+            finally:
+                os.close(fd)
+        except OSError:
+            pass
+
+def init_preprocess_worker():
+    """Build the face detector once per worker process instead of on its first image"""
+    get_face_detector()
+
+def configure_gpu() -> bool:
+    """Let TF grow GPU memory on demand instead of reserving the whole device; True if a GPU exists"""
+    import tensorflow as tf
+    gpus = tf.config.list_physical_devices('GPU')
+    for gpu in gpus:
+        tf.config.experimental.set_memory_growth(gpu, True)
+    return bool(gpus)
+
+_use_gpu = None
+
+def embed_faces(faces: np.ndarray) -> np.ndarray:
+    """Run ArcFace on a (B, 112, 112, 3) batch and L2-normalize each embedding"""
+    global _use_gpu
+    faces = np.ascontiguousarray(faces, dtype=np.float32)
+    
+    session = get_onnx_session()
+    if session is not None:
+        input_name = session.get_inputs()[0].name
+        embeddings = session.run(None, {input_name: faces})[0]
+    else:
+        import tensorflow as tf
+        if _use_gpu is None:
+            _use_gpu = configure_gpu()
+        
+        # One contiguous float32 host buffer -> one H2D copy per batch, made explicitly on the GPU
+        with tf.device('/GPU:0' if _use_gpu else '/CPU:0'):
+            inputs = tf.convert_to_tensor(faces)
+            embeddings = get_arcface_model()(inputs, training=False).numpy()
+    # Normalize for cosine similarity: one fused reduction over the batch, then one broadcast multiply
+    embeddings = embeddings.astype(np.float32, copy=False)
+    embeddings *= np.reciprocal(np.sqrt(np.einsum('ij,ij->i', embeddings, embeddings)))[:, None]
+    return embeddings
+
 def load_faces_to_database():
     """Load all faces (synthetic + LFW) into Milvus database"""
     
@@ -74,7 +237,7 @@ def load_faces_to_database():
     fields = [
         FieldSchema(name="id", dtype=DataType.INT64, is_primary=True, auto_id=True),
         FieldSchema(name="face_id", dtype=DataType.VARCHAR, max_length=100),
-        FieldSchema(name="embedding", dtype=DataType.FLOAT_VECTOR, dim=DIMENSION),
+        FieldSchema(name="embedding", dtype=DataType[MILVUS_VECTOR_TYPE], dim=DIMENSION),
         FieldSchema(name="image_path", dtype=DataType.VARCHAR, max_length=500),
         FieldSchema(name="person_name", dtype=DataType.VARCHAR, max_length=100)
     ]
@@ -95,8 +258,8 @@ def load_faces_to_database():
     # Create index for vector search
     index_params = {
         "metric_type": "COSINE",
-        "index_type": "IVF_FLAT",
-        "params": {"nlist": 128}
+        "index_type": MILVUS_INDEX_TYPE,
+        "params": INDEX_BUILD_PARAMS[MILVUS_INDEX_TYPE]
     }
     collection.create_index(field_name="embedding", index_params=index_params)
     
@@ -120,6 +283,19 @@ def load_faces_to_database():
         face_files.extend([(f, "lfw", f.stem.split('_')[0]) for f in lfw_files])
         print(f"📁 Found {len(lfw_files)} LFW real faces")
     
+    # Drop byte-identical files (e.g. duplicated LFW crops) before paying for detection and ArcFace;
+    # hashing releases the GIL, so a thread pool reads and hashes files in parallel
+    seen_digests = set()
+    unique_files = []
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as hash_pool:
+        for entry, digest in zip(face_files, hash_pool.map(file_digest, [f for f, _, _ in face_files])):
+            if digest not in seen_digests:
+                seen_digests.add(digest)
+                unique_files.append(entry)
+    if len(unique_files) < len(face_files):
+        print(f"🔁 Skipping {len(face_files) - len(unique_files)} duplicate face files")
+    face_files = unique_files
+    
     print(f"📊 Total faces to process: {len(face_files)}")
     
     if len(face_files) == 0:
@@ -127,55 +303,123 @@ def load_faces_to_database():
         print("💡 Run download_lfw.py first or add synthetic faces")
         return False
     
-    # Process faces in batches
-    batch_size = 50
-    batch_data = []
+    # Process faces in batches (large inserts; one flush at the end instead of one per batch)
+    batch_size = 1000
     processed_count = 0
     failed_count = 0
+    pending_insert = None
+    
+    # Columns for the whole ingest, allocated once: row r of every column is the r-th embedded face.
+    # Inserts send slices of them (views of the matrix), so no vector buffer is allocated per batch
+    all_embeddings = np.empty((len(face_files), DIMENSION), dtype=VECTOR_DTYPE)
+    all_face_ids = [None] * len(face_files)
+    all_paths = [None] * len(face_files)
+    all_names = [None] * len(face_files)
+    inserted_count = 0  # rows [0, inserted_count) have been sent to Milvus
+    
+    def insert_batch():
+        """Send the rows filled since the last insert without blocking; at most one insert is in flight"""
+        nonlocal pending_insert, inserted_count
+        if pending_insert is not None:
+            pending_insert.result()
+        rows = slice(inserted_count, processed_count)
+        # Columns follow the schema order (auto_id primary key omitted); filled rows are never rewritten
+        pending_insert = collection.insert(
+            [all_face_ids[rows], all_embeddings[rows], all_paths[rows], all_names[rows]],
+            _async=True
+        )
+        inserted_count = processed_count
     
     print("🔄 Processing faces and generating embeddings...")
+    if get_onnx_session() is not None:
+        print(f"⚡ Using int8 ArcFace from {ARCFACE_INT8_ONNX_PATH} ({get_onnx_session().get_providers()[0]})")
+    
+    # Decode/detect/align is CPU-bound Python, so it runs in worker processes (one per core)
+    # while this process stacks their crops and runs the batched ArcFace forward passes.
+    # Workers are spawned, not forked: TF, the ORT session, the gRPC channel and the prefetch
+    # thread already exist here and none of them survive a fork
+    face_paths = [str(face_path) for face_path, _, _ in face_files]
+    threading.Thread(target=prefetch_files, args=(face_paths,), daemon=True).start()
+    executor = ProcessPoolExecutor(max_workers=os.cpu_count(), initializer=init_preprocess_worker,
+                                   mp_context=get_context('spawn'))
+    
+    def aligned_crops():
+        """Yield crops in file order, keeping only PREPROCESS_AHEAD submitted at a time"""
+        remaining_paths = iter(face_paths)
+        window = deque(executor.submit(preprocess_face, path) for path in islice(remaining_paths, PREPROCESS_AHEAD))
+        while window:
+            crop = window.popleft().result()
+            window.extend(executor.submit(preprocess_face, path) for path in islice(remaining_paths, 1))
+            yield crop
+    
+    crops = aligned_crops()
     
-    for i, (face_path, source_type, person_name) in enumerate(face_files):
+    # One inference thread: while the GPU runs chunk N, this thread gathers crops for chunk N+1
+    inference = ThreadPoolExecutor(max_workers=1)
+    pending = None
+    
+    def collect_embeddings(chunk_start, metas, future):
+        """Turn one finished inference batch into rows, inserting whenever batch_size is reached"""
+        nonlocal processed_count, failed_count
         try:
-            # Extract embedding
-            embedding = extract_face_embedding(str(face_path))
+            embeddings = future.result()
+        except Exception as e:
+            print(f"⚠️ Error embedding batch starting at {chunk_start}: {e}")
+            failed_count += len(metas)
+            return
+        
+        for (i, face_path, source_type, person_name), embedding in zip(metas, embeddings):
+            # Handle both absolute and relative paths safely
+            try:
+                relative_path = face_path.relative_to(Path.cwd())
+            except ValueError:
+                # If relative_to fails, just use the filename
+                relative_path = face_path.name
             
-            if embedding is not None:
-                face_id = f"{source_type}_{i:06d}"
-                
-                # Handle both absolute and relative paths safely
-                try:
-                    relative_path = face_path.relative_to(Path.cwd())
-                except ValueError:
-                    # If relative_to fails, just use the filename
-                    relative_path = face_path.name
-                
-                batch_data.append({
-                    "face_id": face_id,
-                    "embedding": embedding.tolist(),
-                    "image_path": str(relative_path),
-                    "person_name": person_name
-                })
-                
-                processed_count += 1
-            else:
-                failed_count += 1
+            # Fill the next row of each column in place; no per-row dict or Python float list
+            row = processed_count
+            all_embeddings[row] = embedding  # casts to fp16 on assignment when the field is FLOAT16_VECTOR
+            all_face_ids[row] = f"{source_type}_{i:06d}"
+            all_paths[row] = str(relative_path)
+            all_names[row] = person_name
+            
+            processed_count += 1
             
             # Insert batch when full
-            if len(batch_data) >= batch_size:
-                collection.insert(batch_data)
-                collection.flush()  # Ensure data is persisted
+            if processed_count - inserted_count == batch_size:
+                insert_batch()
                 print(f"📊 Processed {processed_count}/{len(face_files)} faces ({failed_count} failed)")
-                batch_data = []
-            
-        except Exception as e:
-            print(f"⚠️ Error processing {face_path}: {e}")
-            failed_count += 1
+    
+    for chunk_start in range(0, len(face_files), EMBEDDING_BATCH_SIZE):
+        chunk = face_files[chunk_start:chunk_start + EMBEDDING_BATCH_SIZE]
+        
+        # Collect each aligned face, then embed the whole chunk in one forward pass
+        faces, metas = [], []
+        for i, (face_path, source_type, person_name) in enumerate(chunk, start=chunk_start):
+            face = next(crops)
+            if face is None:
+                failed_count += 1
+                continue
+            faces.append(face)
+            metas.append((i, face_path, source_type, person_name))
+        
+        # Stage this chunk on the inference thread, then drain the previous one while it runs
+        submitted = (chunk_start, metas, inference.submit(embed_faces, np.stack(faces))) if faces else None
+        if pending is not None:
+            collect_embeddings(*pending)
+        pending = submitted
+    
+    if pending is not None:
+        collect_embeddings(*pending)
+    inference.shutdown()
+    executor.shutdown()
     
     # Insert remaining batch
-    if batch_data:
-        collection.insert(batch_data)
-        collection.flush()  # Ensure data is persisted
+    if processed_count > inserted_count:
+        insert_batch()
+    if pending_insert is not None:
+        pending_insert.result()
+    collection.flush()  # Single seal for the whole load, after every insert has landed
     
     # Load collection for searching
     collection.load()
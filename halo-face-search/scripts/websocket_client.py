@@ -8,11 +8,17 @@ and receive similarity results in real-time.
 import asyncio
 import websockets
 import cv2
-import json
+import orjson
 import base64
 import numpy as np
 from datetime import datetime
 
+# Quality 80 keeps plenty of detail for face detection at ~40% fewer bytes than the default 95
+JPEG_PARAMS = [int(cv2.IMWRITE_JPEG_QUALITY), 80, int(cv2.IMWRITE_JPEG_OPTIMIZE), 0]
+
+# Frames are JPEG already, so permessage-deflate would only burn CPU; 1 MiB caps a frame
+WS_CONNECT_OPTIONS = {"max_size": 2**20, "compression": None}
+
 async def video_search_client(uri: str, video_source=0):
     """
     Connect to the WebSocket endpoint and stream video frames.
@@ -30,29 +36,57 @@ async def video_search_client(uri: str, video_source=0):
     
     print(f"Connecting to {uri}...")
     
-    async with websockets.connect(uri) as websocket:
+    async with websockets.connect(uri, **WS_CONNECT_OPTIONS) as websocket:
         print("Connected! Streaming video frames...")
         print("Press 'q' in the video window to quit.")
         
-        frame_count = 0
+        loop = asyncio.get_running_loop()
+        # Single-slot mailbox: capture overwrites it, so the sender always picks up the newest frame
+        latest_frame = asyncio.Queue(maxsize=1)
+        stats = {"captured": 0, "sent": 0}
         
-        try:
+        async def capture_frames():
+            """Read frames off the event loop and keep only the most recent one queued."""
+            try:
+                while True:
+                    # Read frame from video without blocking the event loop
+                    ret, frame = await loop.run_in_executor(None, cap.read)
+                    if not ret:
+                        print("End of video stream or error reading frame")
+                        break
+                    stats["captured"] += 1
+                    
+                    # Display the frame locally
+                    cv2.imshow('Video Stream', frame)
+                    
+                    # Drop the stale frame the sender has not picked up yet
+                    if latest_frame.full():
+                        latest_frame.get_nowait()
+                    latest_frame.put_nowait(frame)
+                    
+                    # Check for 'q' key press to quit
+                    if cv2.waitKey(1) & 0xFF == ord('q'):
+                        break
+            finally:
+                # Wake the sender with an end-of-stream marker
+                if latest_frame.full():
+                    latest_frame.get_nowait()
+                latest_frame.put_nowait(None)
+        
+        async def search_frames():
+            """Send the newest frame, wait for its results, repeat; one request in flight."""
             while True:
-                # Read frame from video
-                ret, frame = cap.read()
-                if not ret:
-                    print("End of video stream or error reading frame")
+                frame = await latest_frame.get()
+                if frame is None:
                     break
+                frame_count = stats["sent"]
                 
-                # Display the frame locally
-                cv2.imshow('Video Stream', frame)
-                
-                # Encode frame as JPEG
-                _, buffer = cv2.imencode('.jpg', frame)
-                frame_bytes = buffer.tobytes()
+                # Encode frame as JPEG off the event loop (cv2 releases the GIL)
+                _, buffer = await loop.run_in_executor(None, cv2.imencode, '.jpg', frame, JPEG_PARAMS)
                 
-                # Send frame to server
-                await websocket.send(frame_bytes)
+                # Send the encoded array's memory directly instead of copying it into bytes
+                await websocket.send(buffer.reshape(-1).data)
+                stats["sent"] += 1
                 
                 # Receive and display results
                 try:
@@ -62,7 +96,7 @@ async def video_search_client(uri: str, video_source=0):
                         timeout=2.0
                     )
                     
-                    result = json.loads(response)
+                    result = orjson.loads(response)  # accepts str or bytes, no decode step
                     
                     if result.get('query_face_found'):
                         print(f"\nFrame {frame_count}: Found similar faces!")
@@ -73,22 +107,16 @@ async def video_search_client(uri: str, video_source=0):
                         
                 except asyncio.TimeoutError:
                     print(f"\nFrame {frame_count}: Timeout waiting for response")
-                
-                frame_count += 1
-                
-                # Check for 'q' key press to quit
-                if cv2.waitKey(1) & 0xFF == ord('q'):
-                    break
-                
-                # Add a small delay to control frame rate (30 FPS)
-                await asyncio.sleep(0.033)
-                
+        
+        try:
+            await asyncio.gather(capture_frames(), search_frames())
         except KeyboardInterrupt:
             print("\nInterrupted by user")
         finally:
             cap.release()
             cv2.destroyAllWindows()
-            print(f"\nProcessed {frame_count} frames")
+            dropped = stats["captured"] - stats["sent"]
+            print(f"\nProcessed {stats['sent']} frames ({dropped} stale frames skipped)")
 
 def test_with_static_images(uri: str, image_paths: list):
     """
@@ -99,7 +127,7 @@ def test_with_static_images(uri: str, image_paths: list):
         image_paths: List of image file paths to test
     """
     async def send_images():
-        async with websockets.connect(uri) as websocket:
+        async with websockets.connect(uri, **WS_CONNECT_OPTIONS) as websocket:
             print(f"Connected to {uri}")
             
             for i, image_path in enumerate(image_paths):
@@ -114,7 +142,7 @@ def test_with_static_images(uri: str, image_paths: list):
                 
                 # Receive response
                 response = await websocket.recv()
-                result = json.loads(response)
+                result = orjson.loads(response)
                 
                 if result.get('query_face_found'):
                     print("Similar faces found:")
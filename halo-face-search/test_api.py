@@ -4,17 +4,20 @@ Simple test script for the Facial Similarity Search API
 """
 
 import requests
-import json
+import orjson
 import sys
 
 API_BASE_URL = "http://localhost:8000"
 
+# One keep-alive connection shared by every call
+SESSION = requests.Session()
+
 def test_health():
     """Test the health endpoint"""
     print("Testing health endpoint...")
-    response = requests.get(f"{API_BASE_URL}/health")
+    response = SESSION.get(f"{API_BASE_URL}/health")
     print(f"Status: {response.status_code}")
-    print(f"Response: {response.json()}")
+    print(f"Response: {orjson.loads(response.content)}")
     return response.status_code == 200
 
 def test_search(image_path):
@@ -23,12 +26,12 @@ def test_search(image_path):
     
     with open(image_path, 'rb') as f:
         files = {'image_file': (image_path, f, 'image/jpeg')}
-        response = requests.post(f"{API_BASE_URL}/search", files=files)
+        response = SESSION.post(f"{API_BASE_URL}/search", files=files)
     
     print(f"Status: {response.status_code}")
     
     if response.status_code == 200:
-        result = response.json()
+        result = orjson.loads(response.content)
         print(f"Face found: {result['query_face_found']}")
         
         if result['query_face_found']:
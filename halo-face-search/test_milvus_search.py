@@ -25,7 +25,7 @@ try:
         
         if stats.get('row_count', 0) > 0:
             # Create a test embedding (same dimensions as your ArcFace embeddings)
-            test_embedding = np.random.random(512).tolist()
+            test_embedding = np.random.random(512).astype(np.float32)  # contiguous float32, no boxed floats
             print("🔍 Testing search with random embedding...")
             
             # Try the search with minimal parameters
@@ -5,12 +5,86 @@ Real face dataset for production face recognition system
 """
 
 import os
+import posixpath
+import asyncio
+import aiofiles
+import httpx
 import requests
 import tarfile
 import shutil
 from tqdm import tqdm
 import json
 import subprocess
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+MANIFEST_NAME = '.organized.json'
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024  # bytes per read from the HTTP stream
+
+# Evaluation lists published next to the archive (verification pairs, per-person image counts)
+LFW_ANNOTATION_URLS = {
+    'pairs.txt': "http://vis-www.cs.umass.edu/lfw/pairs.txt",
+    'people.txt': "http://vis-www.cs.umass.edu/lfw/people.txt",
+}
+
+def read_manifest(manifest_path):
+    """Return the JSON manifest left by a previous run, or None"""
+    try:
+        with open(manifest_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def write_manifest(manifest_path, manifest):
+    """Record what a completed run produced so identical reruns can skip the work"""
+    with open(manifest_path, 'w') as f:
+        json.dump(manifest, f)
+
+def count_faces(face_dir):
+    """Face count from the directory's metadata.json when present, else one streaming scandir pass"""
+    metadata = read_manifest(os.path.join(face_dir, 'metadata.json'))
+    if metadata and 'total_faces' in metadata:
+        return metadata['total_faces']
+    if not os.path.isdir(face_dir):
+        return 0
+    with os.scandir(face_dir) as entries:
+        return sum(1 for entry in entries if entry.is_file())
+
+async def fetch_file(client, url, path):
+    """Stream one URL to path in 1MB chunks via a .part file, renamed into place when complete"""
+    partial_path = f"{path}.part"
+    async with client.stream("GET", url) as response:
+        response.raise_for_status()
+        async with aiofiles.open(partial_path, 'wb') as f:
+            async for chunk in response.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+                await f.write(chunk)
+    os.replace(partial_path, path)
+    return path
+
+async def fetch_lfw_annotations(annotation_dir):
+    """Fetch the missing LFW annotation files concurrently over one pooled client"""
+    os.makedirs(annotation_dir, exist_ok=True)
+    targets = {name: os.path.join(annotation_dir, name) for name in LFW_ANNOTATION_URLS}
+    missing = [name for name, path in targets.items() if not os.path.exists(path)]
+    if not missing:
+        return list(targets.values())
+    
+    limits = httpx.Limits(max_connections=4)
+    async with httpx.AsyncClient(timeout=httpx.Timeout(30, read=None), limits=limits) as client:
+        results = await asyncio.gather(
+            *(fetch_file(client, LFW_ANNOTATION_URLS[name], targets[name]) for name in missing),
+            return_exceptions=True
+        )
+    
+    # The face images are usable without the annotations, so a failed fetch is only a warning
+    for name, result in zip(missing, results):
+        if isinstance(result, Exception):
+            print(f"⚠️ Could not fetch LFW {name}: {result}")
+    return [path for path in targets.values() if os.path.exists(path)]
+
+def download_lfw_annotations(data_dir='data'):
+    """Blocking entry point for fetch_lfw_annotations, safe to run in a worker thread"""
+    return asyncio.run(fetch_lfw_annotations(os.path.join(data_dir, 'lfw_annotations')))
 
 def download_lfw_dataset(data_dir='data'):
     """Download LFW dataset - 13,233 images of 5,749 people"""
@@ -26,95 +100,118 @@ def download_lfw_dataset(data_dir='data'):
     
     # LFW dataset URL (official mirror)
     lfw_url = "http://vis-www.cs.umass.edu/lfw/lfw.tgz"
-    lfw_tar_path = os.path.join(data_dir, 'lfw.tgz')
     
     try:
-        # Download LFW dataset
+        # Stream the archive straight from the response into the flat face directory:
+        # no tarball on disk, no extracted tree, no copy pass
         print(f"📥 Downloading LFW dataset from: {lfw_url}")
         print("⏳ This may take a few minutes (145MB download)...")
         
-        response = requests.get(lfw_url, stream=True)
-        response.raise_for_status()
-        
-        total_size = int(response.headers.get('content-length', 0))
-        
-        with open(lfw_tar_path, 'wb') as f, tqdm(
-            desc="Downloading",
-            total=total_size,
-            unit='B',
-            unit_scale=True,
-            unit_divisor=1024,
-        ) as pbar:
-            for chunk in response.iter_content(chunk_size=8192):
-                if chunk:
-                    f.write(chunk)
-                    pbar.update(len(chunk))
-        
-        print(f"✅ Downloaded LFW dataset: {lfw_tar_path}")
-        
-        # Extract the dataset
-        print("📦 Extracting LFW dataset...")
-        with tarfile.open(lfw_tar_path, 'r:gz') as tar:
-            tar.extractall(data_dir)
-        
-        # Move extracted files to proper location
-        extracted_lfw = os.path.join(data_dir, 'lfw')
-        if os.path.exists(extracted_lfw):
-            print("📁 Organizing LFW faces...")
+        manifest_path = os.path.join(lfw_dir, MANIFEST_NAME)
+        with requests.get(lfw_url, stream=True) as response:
+            response.raise_for_status()
+            response.raw.decode_content = True
             
-            # Count and organize faces
-            face_count = 0
-            for person_dir in os.listdir(extracted_lfw):
-                person_path = os.path.join(extracted_lfw, person_dir)
-                if os.path.isdir(person_path):
-                    for face_file in os.listdir(person_path):
-                        if face_file.lower().endswith(('.jpg', '.jpeg')):
-                            # Copy to flat structure for easier processing
-                            src = os.path.join(person_path, face_file)
-                            # Create unique filename: person_image.jpg
-                            dst_name = f"{person_dir}_{face_file}"
-                            dst = os.path.join(lfw_dir, dst_name)
-                            shutil.copy2(src, dst)
-                            face_count += 1
+            total_size = int(response.headers.get('content-length', 0))
             
-            print(f"✅ Organized {face_count} LFW faces in {lfw_dir}")
+            # ETag + length identify the archive; if this exact archive was already extracted, skip the body
+            source = f"{response.headers.get('etag', '')}:{total_size}"
+            manifest = read_manifest(manifest_path)
+            if total_size and manifest and manifest.get('source') == source:
+                print(f"✅ Already organized {manifest['face_count']} LFW faces in {lfw_dir}, skipping download")
+                download_lfw_annotations(data_dir)
+                return True
             
-            # Clean up
-            shutil.rmtree(extracted_lfw)
-            os.remove(lfw_tar_path)
+            # Download and extraction run as two threads joined by an OS pipe: the socket reads and
+            # the gunzip both release the GIL, so the archive downloads while earlier members are
+            # being inflated and written, and the total is close to the slower stage instead of the sum
+            read_fd, write_fd = os.pipe()
             
-            print("🎉 LFW dataset ready for face recognition!")
-            print(f"📊 Total faces available: {len(os.listdir(os.path.join(data_dir, 'synthetic_faces')))} synthetic + {face_count} real")
+            def download():
+                # 1MB reads mean ~170 socket reads and progress updates for the whole archive, and
+                # the bar repaints at most twice a second however fast the reads arrive
+                with os.fdopen(write_fd, 'wb') as pipe_out, \
+                        tqdm.wrapattr(response.raw, "read", total=total_size, desc="Downloading",
+                                      mininterval=0.5) as raw:
+                    shutil.copyfileobj(raw, pipe_out, DOWNLOAD_CHUNK_SIZE)
             
-            return True
+            def extract():
+                extracted = 0
+                with os.fdopen(read_fd, 'rb') as pipe_in:
+                    with tarfile.open(fileobj=pipe_in, mode='r|gz', bufsize=DOWNLOAD_CHUNK_SIZE) as tar:
+                        for member in tar:
+                            face_file = posixpath.basename(member.name)
+                            if not member.isfile() or not face_file.lower().endswith(('.jpg', '.jpeg')):
+                                continue
+                            
+                            # Create unique filename: person_image.jpg (flat structure for easier processing)
+                            person_dir = posixpath.basename(posixpath.dirname(member.name))
+                            member.name = f"{person_dir}_{face_file}"
+                            tar.extract(member, path=lfw_dir)
+                            extracted += 1
+                    
+                    # Drain the archive padding so the downloader never blocks on a closed pipe
+                    while pipe_in.read(DOWNLOAD_CHUNK_SIZE):
+                        pass
+                return extracted
+            
+            # The small annotation files come down on a third thread while the archive streams
+            with ThreadPoolExecutor(max_workers=3) as executor:
+                annotations_future = executor.submit(download_lfw_annotations, data_dir)
+                download_future = executor.submit(download)
+                extract_future = executor.submit(extract)
+                
+                # A failed download surfaces as a truncated archive in the extractor, so report the
+                # download's own error first; a broken pipe only means the extractor failed
+                download_error = download_future.exception()
+                if download_error is not None and not isinstance(download_error, BrokenPipeError):
+                    raise download_error
+                face_count = extract_future.result()
+                annotation_paths = annotations_future.result()
+        
+        write_manifest(manifest_path, {'source': source, 'face_count': face_count})
+        print(f"✅ Organized {face_count} LFW faces in {lfw_dir}")
+        print(f"📝 LFW annotation files: {len(annotation_paths)}/{len(LFW_ANNOTATION_URLS)}")
+        
+        print("🎉 LFW dataset ready for face recognition!")
+        print(f"📊 Total faces available: {count_faces(os.path.join(data_dir, 'synthetic_faces'))} synthetic + {face_count} real")
+        
+        return True
             
     except Exception as e:
         print(f"❌ Error downloading LFW dataset: {e}")
         print("💡 Alternative: Using synthetic faces only")
         return False
 
-def create_metadata(lfw_dir):
-    """Create metadata file with dataset information"""
+def group_faces_by_person(lfw_dir):
+    """One scandir pass over the face directory, grouped as {person: [filenames]}"""
+    files_by_person = defaultdict(list)
+    with os.scandir(lfw_dir) as entries:
+        for entry in entries:
+            if is_face_entry(entry):
+                # Same person key the ingest scripts use (text before the first underscore)
+                files_by_person[entry.name.split('_', 1)[0]].append(entry.name)
+    return files_by_person
+
+def create_metadata(lfw_dir, files_by_person=None):
+    """Create metadata file with dataset information; returns the person groups for reuse"""
     
     print("📝 Creating metadata...")
     
     # Count files and people
-    face_files = [f for f in os.listdir(lfw_dir) if f.lower().endswith(('.jpg', '.jpeg', '.png'))]
-    
-    # Extract person names
-    people = set()
-    for filename in face_files:
-        person_name = filename.split('_')[0]
-        people.add(person_name)
+    if files_by_person is None:
+        files_by_person = group_faces_by_person(lfw_dir)
+    total_faces = sum(len(files) for files in files_by_person.values())
+    people = sorted(files_by_person)
     
     metadata = {
         "dataset": "LFW (Labeled Faces in the Wild)",
         "description": "Real face dataset for face recognition",
-        "total_faces": len(face_files),
+        "total_faces": total_faces,
         "total_people": len(people),
         "source": "http://vis-www.cs.umass.edu/lfw/",
         "purpose": "Production face recognition system",
-        "sample_people": sorted(list(people))[:20],  # First 20 people as sample
+        "sample_people": people[:20],  # First 20 people as sample
         "image_format": "JPG",
         "organized_date": str(os.path.getctime(lfw_dir))
     }
@@ -124,34 +221,75 @@ def create_metadata(lfw_dir):
         json.dump(metadata, f, indent=2)
     
     print(f"✅ Metadata saved: {metadata_path}")
-    print(f"📊 Dataset: {len(face_files)} faces from {len(people)} people")
+    print(f"📊 Dataset: {total_faces} faces from {len(people)} people")
+    
+    return files_by_person
+
+def is_face_entry(entry):
+    """True for a regular image file in an os.scandir listing"""
+    return entry.name.lower().endswith(('.jpg', '.jpeg', '.png')) and entry.is_file()
+
+def link_or_copy(source, target):
+    """Hardlink target to source (no data copied); fall back to a copy across filesystems"""
+    try:
+        os.link(source, target)
+    except FileExistsError:
+        pass
+    except OSError:
+        shutil.copy2(source, target)
 
-def sample_faces_for_demo(lfw_dir, sample_dir='data/sample_faces', max_faces=1000):
+def sample_across_people(files_by_person, max_faces):
+    """Pick up to max_faces, spread evenly over people first, then over each person's further images"""
+    people = sorted(files_by_person)
+    # Sorted, so the sample doesn't depend on the filesystem's directory order
+    files = {person: sorted(files_by_person[person]) for person in people}
+    sampled_faces = []
+    round_index = 0
+    while len(sampled_faces) < max_faces:
+        # People who still have an image for this round
+        remaining = [person for person in people if round_index < len(files[person])]
+        if not remaining:
+            break
+        needed = max_faces - len(sampled_faces)
+        step = max(1, len(remaining) // needed)
+        sampled_faces.extend(files[person][round_index] for person in remaining[::step][:needed])
+        round_index += 1
+    return sampled_faces
+
+def sample_faces_for_demo(lfw_dir, sample_dir='data/sample_faces', max_faces=1000, files_by_person=None):
     """Create a sample subset for faster demo/testing"""
     
     print(f"\n🎯 Creating sample dataset ({max_faces} faces) for demo...")
     
     os.makedirs(sample_dir, exist_ok=True)
     
-    # Get all face files
-    face_files = [f for f in os.listdir(lfw_dir) 
-                  if f.lower().endswith(('.jpg', '.jpeg', '.png'))]
+    # Reuse the groups create_metadata already built; otherwise one scandir pass builds them
+    if files_by_person is None:
+        files_by_person = group_faces_by_person(lfw_dir)
+    source_count = sum(len(files) for files in files_by_person.values())
+    
+    # Same source and sampling parameters as the last completed run: the sample is already in place
+    manifest_path = os.path.join(sample_dir, MANIFEST_NAME)
+    sample_key = {'source_count': source_count, 'people': len(files_by_person), 'max_faces': max_faces,
+                  'sampling': 'across_people'}
+    if read_manifest(manifest_path) == sample_key:
+        print(f"✅ Sample already up to date: {sample_dir}")
+        return sample_dir
     
-    # Sample faces (take every nth face to ensure diversity)
-    step = max(1, len(face_files) // max_faces)
-    sampled_faces = face_files[::step][:max_faces]
+    # Sample across people so no one is skipped while others contribute several faces
+    sampled_faces = sample_across_people(files_by_person, max_faces)
     
-    print(f"📥 Copying {len(sampled_faces)} faces to sample directory...")
+    print(f"📥 Linking {len(sampled_faces)} faces into sample directory...")
     
     for i, face_file in enumerate(sampled_faces):
         source = os.path.join(lfw_dir, face_file)
         target = os.path.join(sample_dir, face_file)
         
-        if not os.path.exists(target):
-            shutil.copy2(source, target)
+        # Existing targets raise FileExistsError inside link_or_copy, so no separate exists() stat
+        link_or_copy(source, target)
         
         if (i + 1) % 100 == 0:
-            print(f"   Copied {i + 1}/{len(sampled_faces)} faces...")
+            print(f"   Linked {i + 1}/{len(sampled_faces)} faces...")
     
     # Create sample metadata
     sample_metadata = {
@@ -163,6 +301,7 @@ def sample_faces_for_demo(lfw_dir, sample_dir='data/sample_faces', max_faces=100
     
     with open(os.path.join(sample_dir, 'metadata.json'), 'w') as f:
         json.dump(sample_metadata, f, indent=2)
+    write_manifest(manifest_path, sample_key)
     
     print(f"✅ Sample dataset ready: {sample_dir}")
     print(f"🚀 {len(sampled_faces)} faces ready for embedding generation!")
@@ -172,8 +311,12 @@ def sample_faces_for_demo(lfw_dir, sample_dir='data/sample_faces', max_faces=100
 if __name__ == "__main__":
     download_lfw_dataset()
     
+    # Group the faces once and share the groups between metadata and sampling
+    lfw_dir = os.path.join('data', 'lfw_faces')
+    files_by_person = create_metadata(lfw_dir)
+    
     # Create sample for demo (1000 faces)
-    sample_dir = sample_faces_for_demo(max_faces=1000)
+    sample_dir = sample_faces_for_demo(lfw_dir, max_faces=1000, files_by_person=files_by_person)
     
     print("\n🎯 Ready for next step: Generate embeddings!")
     print("Run: python scripts/generate_embeddings.py") 
\ No newline at end of file
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Export the DeepFace ArcFace model to ONNX
+The API serves this graph through ONNX Runtime when it is present; the embedding
+generator prefers the dynamically quantized int8 copy written alongside it
+"""
+
+import os
+import sys
+import warnings
+
+warnings.filterwarnings("ignore")
+os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
+
+import tensorflow as tf
+import tf2onnx
+from deepface import DeepFace
+from onnxruntime.quantization import quantize_dynamic, QuantType
+
+OUTPUT_PATH = os.getenv("ARCFACE_ONNX_PATH", "models/arcface.onnx")
+INT8_OUTPUT_PATH = os.getenv("ARCFACE_INT8_ONNX_PATH", "models/arcface_int8.onnx")
+OPSET = 17
+
+def export_arcface(output_path: str = OUTPUT_PATH, opset: int = OPSET):
+    """Convert the Keras ArcFace model to an ONNX graph with a dynamic batch axis"""
+    
+    print("🔄 Building ArcFace model via DeepFace...")
+    model = DeepFace.build_model("ArcFace").model
+    
+    # Dynamic batch dimension so the API can run batched inference
+    input_signature = [tf.TensorSpec((None, 112, 112, 3), tf.float32, name="input")]
+    
+    output_dir = os.path.dirname(output_path)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    
+    print(f"📦 Exporting to ONNX (opset {opset})...")
+    tf2onnx.convert.from_keras(
+        model,
+        input_signature=input_signature,
+        opset=opset,
+        output_path=output_path
+    )
+    
+    print(f"✅ Saved ArcFace ONNX model: {output_path}")
+    return output_path
+
+def quantize_arcface(input_path: str = OUTPUT_PATH, output_path: str = INT8_OUTPUT_PATH):
+    """Quantize the ArcFace weights to int8; activations are quantized per batch at run time"""
+    
+    print("🔄 Quantizing ArcFace weights to int8...")
+    quantize_dynamic(input_path, output_path, weight_type=QuantType.QInt8)
+    
+    print(f"✅ Saved int8 ArcFace ONNX model: {output_path}")
+    return output_path
+
+if __name__ == "__main__":
+    output = sys.argv[1] if len(sys.argv) > 1 else OUTPUT_PATH
+    int8_output = sys.argv[2] if len(sys.argv) > 2 else INT8_OUTPUT_PATH
+    quantize_arcface(export_arcface(output), int8_output)
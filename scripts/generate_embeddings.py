@@ -7,62 +7,206 @@ This populates the face search database with real face data
 import os
 import sys
 import json
+import math
+import shelve
+import hashlib
 import numpy as np
 from pathlib import Path
 from tqdm import tqdm
 import warnings
 from typing import List, Dict, Any
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import islice
+from multiprocessing import get_context
 
 # Add project root to path
 project_root = Path(__file__).parent.parent
 sys.path.append(str(project_root))
 
 from deepface import DeepFace
-from pymilvus import MilvusClient, DataType, CollectionSchema, FieldSchema
+from pymilvus import MilvusClient, DataType, CollectionSchema, FieldSchema, Collection, connections
+
+try:
+    import onnxruntime as ort
+except ImportError:
+    ort = None
 
 # Suppress warnings for cleaner output
 warnings.filterwarnings("ignore")
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
 
+ARCFACE_INPUT_SIZE = (112, 112)
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.tiff')  # a tuple, for one str.endswith call
+
+# ArcFace graphs from scripts/export_arcface_onnx.py; the int8 one is preferred when present,
+# and the Keras model is the fallback when neither exists or onnxruntime is missing
+ARCFACE_ONNX_PATH = os.getenv("ARCFACE_ONNX_PATH", "models/arcface.onnx")
+ARCFACE_INT8_ONNX_PATH = os.getenv("ARCFACE_INT8_ONNX_PATH", "models/arcface_int8.onnx")
+
+# Inserts run on a small thread pool behind the embedding loop; past this many in flight the
+# loop waits on the oldest so the Milvus proxy task queue never fills up
+INSERT_WORKERS = 4
+MAX_PENDING_INSERTS = 8
+
+# fp16 vectors halve Milvus memory and insert/search bandwidth; unit-norm ArcFace scores
+# barely move at fp16 precision. Existing collections keep whatever type they were created with
+MILVUS_VECTOR_TYPE = os.getenv("MILVUS_VECTOR_TYPE", "FLOAT16_VECTOR").upper()
+
+# Rows per insert RPC: 1000 x 512 float32 is ~2MB (1MB at fp16), far under gRPC's 64MB message limit
+INSERT_BATCH_SIZE = 1000
+MAX_INSERT_BYTES = 64 * 1024 * 1024
+
+# face_ids fetched per page when listing what is already stored
+EXISTING_FACES_PAGE_SIZE = 10000
+
+# Past this many stored rows the existing face_ids go into a Bloom filter (~1.2 bytes per id at
+# 1% false positives) instead of a set of strings; hits are then confirmed with exact queries
+EXISTING_FACES_BLOOM_MIN_ROWS = 1_000_000
+BLOOM_ERROR_RATE = 0.01
+CONFIRM_QUERY_BATCH = 1000
+
+# Embeddings computed by earlier runs, keyed by the image's content hash, so reruns after a
+# dropped collection or schema change skip detection and inference for unchanged files
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", ".embcache.db")
+EMBEDDING_CACHE_KEY_PREFIX = "arcface-opencv-112"  # change when the preprocessing changes
+
+def content_key(image_path: str, backend: str) -> str:
+    """Embedding cache key: BLAKE2b of the image bytes under the preprocessing and model backend"""
+    with open(image_path, 'rb') as f:
+        digest = hashlib.blake2b(f.read(), digest_size=16).hexdigest()
+    return f"{EMBEDDING_CACHE_KEY_PREFIX}:{backend}:{digest}"
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings: a NumPy bit array probed by k hashes of one BLAKE2b digest"""
+    
+    def __init__(self, capacity: int, error_rate: float = BLOOM_ERROR_RATE):
+        capacity = max(1, capacity)
+        self.num_bits = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.bits = np.zeros((self.num_bits + 7) // 8, dtype=np.uint8)
+        self.count = 0
+    
+    def _positions(self, item: str):
+        # Double hashing: positions h1 + i*h2 behave like k independent hashes
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+    
+    def add(self, item: str):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+    
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+    
+    def __len__(self) -> int:
+        return self.count
+
 class FaceEmbeddingGenerator:
     """Generate and store face embeddings for the Halo face search system"""
     
     def __init__(self, milvus_uri="http://localhost:19530"):
         self.milvus_client = MilvusClient(uri=milvus_uri)
+        # ORM connection for column-oriented inserts of the embedding matrix
+        connections.connect("default", uri=milvus_uri)
+        self.collection = None
         self.collection_name = "face_embeddings"
+        self.created_collection = False  # set by ensure_collection_schema when it had to create one
         self.dimension = 512  # ArcFace embedding dimension
+        self.vector_dtype = np.float16 if MILVUS_VECTOR_TYPE == "FLOAT16_VECTOR" else np.float32
+        onnx_path = self._find_onnx_model()
+        self._session = self._create_onnx_session(onnx_path) if onnx_path else None
+        # Without an ONNX graph, build the Keras ArcFace once up front; every batch reuses it
+        self._model = None if self._session is not None else DeepFace.build_model("ArcFace")
+        # Keras, fp32 ONNX and int8 ONNX embeddings differ slightly, so each keeps its own cache entries
+        self._backend = os.path.basename(onnx_path) if onnx_path else "keras"
+        self._insert_pool = ThreadPoolExecutor(max_workers=INSERT_WORKERS)
+        self._pending_inserts = deque()
+        self._cache = shelve.open(EMBEDDING_CACHE_PATH)
         
         print("🚀 Initializing Halo Face Embedding Generator")
         print(f"🔗 Connecting to Milvus: {milvus_uri}")
         
-    def extract_face_embedding(self, image_path: str) -> tuple[np.ndarray, bool]:
-        """
-        Extract face embedding using ArcFace model
-        Returns (embedding, success)
-        """
+    @staticmethod
+    def _preprocess(image_path: str) -> np.ndarray:
+        """Detect and align a face, returning a (112, 112, 3) float32 crop ready for ArcFace"""
+        face_objs = DeepFace.extract_faces(
+            img_path=image_path,
+            target_size=ARCFACE_INPUT_SIZE,
+            detector_backend="opencv",
+            enforce_detection=False,
+            align=True
+        )
+        
+        # extract_faces returns RGB for display; ArcFace takes the BGR layout represent() feeds it
+        return face_objs[0]["face"][:, :, ::-1].astype(np.float32)
+    
+    @staticmethod
+    def _find_onnx_model():
+        """Path of the exported ArcFace graph to serve, or None to use the Keras model"""
+        if ort is None:
+            return None
+        return next((path for path in (ARCFACE_INT8_ONNX_PATH, ARCFACE_ONNX_PATH) if os.path.exists(path)), None)
+    
+    @staticmethod
+    def _create_onnx_session(model_path: str):
+        """ONNX Runtime session for the exported ArcFace graph"""
+        sess_options = ort.SessionOptions()
+        sess_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        sess_options.intra_op_num_threads = os.cpu_count()
+        
+        # GPU when this build has it, else OpenVINO's VNNI/AVX-512 CPU kernels, else the default CPU EP
+        available = ort.get_available_providers()
+        providers = [p for p in ("CUDAExecutionProvider", "OpenVINOExecutionProvider", "CPUExecutionProvider")
+                     if p in available]
+        print(f"🧠 ArcFace via ONNX Runtime: {model_path} ({providers[0]})")
+        return ort.InferenceSession(model_path, sess_options=sess_options, providers=providers)
+    
+    def _embed_batch(self, batch: np.ndarray) -> np.ndarray:
+        """Run ArcFace once on a (B, 112, 112, 3) batch and L2-normalize each embedding"""
+        if self._session is not None:
+            input_name = self._session.get_inputs()[0].name
+            embeddings = self._session.run(None, {input_name: batch.astype(np.float32, copy=False)})[0]
+        else:
+            embeddings = self._model.model.predict(batch, batch_size=len(batch), verbose=0)
+        embeddings = embeddings.astype(np.float32, copy=False)
+        # Normalize for cosine similarity: one fused row-wise reduction over the (B, 512) block,
+        # floored so a degenerate all-zero embedding stays finite
+        norms = np.sqrt(np.einsum('ij,ij->i', embeddings, embeddings))
+        embeddings /= np.maximum(norms, 1e-12)[:, None]
+        return embeddings
+    
+    def _submit_insert(self, batch_data: List[Any]):
+        """Queue a batch insert in the background, reaping finished ones and bounding the backlog"""
+        self._pending_inserts.append(self._insert_pool.submit(self.collection.insert, batch_data))
+        while self._pending_inserts and (
+            self._pending_inserts[0].done() or len(self._pending_inserts) > MAX_PENDING_INSERTS
+        ):
+            self._finish_insert(self._pending_inserts.popleft())
+    
+    def _finish_insert(self, future):
+        """Wait for one insert and report its failure, if any"""
         try:
-            # Generate embedding with ArcFace
-            embedding_obj = DeepFace.represent(
-                img_path=image_path,
-                model_name="ArcFace",
-                detector_backend="opencv",
-                enforce_detection=False,
-                align=True,
-                normalization="base"
-            )
-            
-            # Extract and normalize embedding
-            embedding = np.array(embedding_obj[0]["embedding"])
-            embedding = embedding / np.linalg.norm(embedding)  # Normalize for cosine similarity
-            
-            return embedding, True
-            
+            future.result()
         except Exception as e:
-            print(f"⚠️  Failed to process {os.path.basename(image_path)}: {str(e)}")
-            return np.zeros(self.dimension), False
+            print(f"\n❌ Batch insert failed: {e}")
+    
+    def _drain_inserts(self):
+        """Wait for every queued insert to complete"""
+        while self._pending_inserts:
+            self._finish_insert(self._pending_inserts.popleft())
     
-    def ensure_collection_exists(self):
-        """Ensure the Milvus collection exists and is properly configured"""
+    def close(self):
+        """Finish queued inserts, stop the insert pool and close (flushing) the embedding cache"""
+        self._drain_inserts()
+        self._insert_pool.shutdown()
+        self._cache.close()
+    
+    def ensure_collection_schema(self):
+        """Ensure the Milvus collection exists; a new one gets its index only after the bulk load"""
         
         if not self.milvus_client.has_collection(self.collection_name):
             print(f"📦 Creating collection: {self.collection_name}")
@@ -71,134 +215,277 @@ class FaceEmbeddingGenerator:
             schema = CollectionSchema([
                 FieldSchema(name="id", dtype=DataType.INT64, is_primary=True, auto_id=True),
                 FieldSchema(name="face_id", dtype=DataType.VARCHAR, max_length=100),
-                FieldSchema(name="embedding", dtype=DataType.FLOAT_VECTOR, dim=self.dimension),
+                FieldSchema(name="embedding", dtype=DataType[MILVUS_VECTOR_TYPE], dim=self.dimension),
                 FieldSchema(name="image_path", dtype=DataType.VARCHAR, max_length=500),
                 FieldSchema(name="person_name", dtype=DataType.VARCHAR, max_length=200)
             ])
             
-            # Create collection with optimized index
+            # No index and no load yet: inserts land in plain growing segments instead of
+            # paying incremental index maintenance per batch (see finalize_collection)
             self.milvus_client.create_collection(
                 collection_name=self.collection_name,
-                schema=schema,
-                index_params={
-                    "field_name": "embedding",
-                    "index_type": "HNSW",
-                    "metric_type": "COSINE",
-                    "params": {"M": 16, "efConstruction": 200}
-                }
+                schema=schema
             )
-            print(f"✅ Created collection with HNSW index")
+            self.created_collection = True
+            print(f"✅ Created collection (index deferred until after insert)")
         else:
             print(f"✅ Collection {self.collection_name} already exists")
+            
+            # Match the vector dtype to the embedding field as the collection was created
+            for field in self.milvus_client.describe_collection(self.collection_name)["fields"]:
+                if field["name"] == "embedding":
+                    self.vector_dtype = np.float16 if field["type"] == DataType.FLOAT16_VECTOR else np.float32
+            
+            # Loaded (indexed, if an earlier run stopped before finalizing) so the existing
+            # face_ids can be queried and skipped
+            self.finalize_collection()
+        
+        self.collection = Collection(self.collection_name)
+    
+    def finalize_collection(self):
+        """Flush inserted rows, build the HNSW index once if missing, and load for search"""
+        self.milvus_client.flush(self.collection_name)
+        
+        if not self.milvus_client.list_indexes(self.collection_name):
+            print(f"🏗️  Building HNSW index over {self.collection_name}...")
+            index_params = self.milvus_client.prepare_index_params()
+            index_params.add_index(
+                field_name="embedding",
+                index_type="HNSW",
+                metric_type="COSINE",
+                params={"M": 16, "efConstruction": 200}
+            )
+            self.milvus_client.create_index(self.collection_name, index_params)
         
         # Load collection into memory
         self.milvus_client.load_collection(self.collection_name)
         print(f"⚡ Collection loaded into memory for fast search")
     
-    def get_existing_faces(self) -> set:
-        """Get set of face_ids already in database to avoid duplicates"""
+    def get_existing_faces(self):
+        """
+        Get the face_ids already in database to avoid duplicates: an exact set, or for very large
+        collections a BloomFilter whose hits must be confirmed with confirm_existing_faces
+        """
+        # A collection created this run is empty, and not loaded until finalize_collection, so
+        # there is nothing to query (and query_iterator would fail on it)
+        if self.created_collection:
+            return set()
+        
         try:
-            existing = self.milvus_client.query(
+            row_count = self.milvus_client.get_collection_stats(self.collection_name).get('row_count', 0)
+            existing = BloomFilter(row_count) if row_count > EXISTING_FACES_BLOOM_MIN_ROWS else set()
+            add = existing.add
+            
+            # Page through every row rather than one capped query, so nothing is missed past 50k
+            # and no single response has to carry every face_id
+            iterator = self.milvus_client.query_iterator(
                 collection_name=self.collection_name,
+                batch_size=EXISTING_FACES_PAGE_SIZE,
                 filter="",
-                output_fields=["face_id"],
-                limit=50000  # Get all existing face_ids
+                output_fields=["face_id"]
             )
-            return {item['face_id'] for item in existing}
-        except:
+            try:
+                while True:
+                    rows = iterator.next()
+                    if not rows:
+                        break
+                    for row in rows:
+                        add(row['face_id'])
+            finally:
+                iterator.close()
+            return existing
+        except Exception as e:
+            print(f"⚠️  Could not list existing faces, duplicates may be inserted: {e}")
             return set()
     
-    def process_face_dataset(self, faces_dir: str, batch_size: int = 50, max_faces: int = None):
+    def confirm_existing_faces(self, face_ids: List[str]) -> set:
+        """Exact subset of face_ids stored in Milvus, queried in batches"""
+        stored = set()
+        for start in range(0, len(face_ids), CONFIRM_QUERY_BATCH):
+            rows = self.milvus_client.query(
+                collection_name=self.collection_name,
+                filter=f"face_id in {json.dumps(face_ids[start:start + CONFIRM_QUERY_BATCH])}",
+                output_fields=["face_id"]
+            )
+            stored.update(row['face_id'] for row in rows)
+        return stored
+    
+    def process_face_dataset(self, faces_dir: str, batch_size: int = 50, max_faces: int = None,
+                             insert_batch_size: int = INSERT_BATCH_SIZE):
         """
         Process face dataset and generate embeddings
         
         Args:
             faces_dir: Directory containing face images
-            batch_size: Number of faces to process in each batch
+            batch_size: Number of faces to embed in each forward pass
             max_faces: Maximum number of faces to process (None for all)
+            insert_batch_size: Number of rows per Milvus insert
         """
         
         print(f"\n🎯 Processing faces from: {faces_dir}")
         
-        # Get all image files
-        image_extensions = {'.jpg', '.jpeg', '.png', '.bmp', '.tiff'}
-        image_files = [
-            f for f in os.listdir(faces_dir)
-            if Path(f).suffix.lower() in image_extensions
-        ]
-        
-        if max_faces:
-            image_files = image_files[:max_faces]
-        
-        print(f"📸 Found {len(image_files)} face images to process")
-        
         # Check for existing faces
         existing_faces = self.get_existing_faces()
         print(f"🔄 {len(existing_faces)} faces already in database")
         
-        # Filter out already processed faces
+        # One scandir pass filters image files (up to max_faces) and skips already processed ones
+        image_count = 0
         new_faces = []
-        for img_file in image_files:
-            face_id = Path(img_file).stem  # filename without extension
-            if face_id not in existing_faces:
-                new_faces.append(img_file)
+        maybe_existing = []
+        use_bloom = isinstance(existing_faces, BloomFilter)
+        with os.scandir(faces_dir) as entries:
+            for entry in entries:
+                name = entry.name
+                if not name.lower().endswith(IMAGE_EXTENSIONS) or not entry.is_file():
+                    continue
+                image_count += 1
+                face_id = name[:name.rfind('.')]  # filename without extension
+                if face_id not in existing_faces:
+                    new_faces.append(name)
+                elif use_bloom:
+                    maybe_existing.append(name)
+                if max_faces and image_count >= max_faces:
+                    break
+        
+        # A Bloom hit may be a false positive; skipping it would lose that face for good
+        if maybe_existing:
+            stored = self.confirm_existing_faces([name[:name.rfind('.')] for name in maybe_existing])
+            new_faces.extend(name for name in maybe_existing if name[:name.rfind('.')] not in stored)
+        
+        print(f"📸 Found {image_count} face images to process")
         
         print(f"🆕 {len(new_faces)} new faces to process")
         
         if not new_faces:
             print("✅ All faces already processed!")
+            self.finalize_collection()
             return
         
         # Process faces in batches
         successful_embeddings = 0
         failed_embeddings = 0
-        batch_data = []
+        cache_hits = 0
+        
+        # Rows accumulate column by column (schema order, auto id omitted) until an insert is due;
+        # the embedding column goes to pymilvus as one matrix instead of per-row dicts
+        # Cap the vectors at half the gRPC limit, leaving the rest for the string columns
+        vector_bytes = self.dimension * np.dtype(self.vector_dtype).itemsize
+        insert_batch_size = min(insert_batch_size, MAX_INSERT_BYTES // 2 // vector_bytes)
+        face_ids, embedding_blocks, image_paths, person_names = [], [], [], []
         
-        with tqdm(total=len(new_faces), desc="Generating embeddings") as pbar:
-            for i, img_file in enumerate(new_faces):
+        def submit_columns():
+            embeddings = np.concatenate(embedding_blocks).astype(self.vector_dtype, copy=False)
+            self._submit_insert([face_ids[:], embeddings, image_paths[:], person_names[:]])
+            for column in (face_ids, embedding_blocks, image_paths, person_names):
+                column.clear()
+        
+        # Decode + detect + align is CPU-bound per image, so it runs in worker processes
+        # (spawned, not forked, so no TF state is inherited) while this process embeds
+        pending = deque()
+        remaining_files = iter(new_faces)
+        
+        def submit_next(count):
+            for img_file in islice(remaining_files, count):
                 image_path = os.path.join(faces_dir, img_file)
-                
+                try:
+                    key = content_key(image_path, self._backend)
+                    cached = self._cache.get(key)
+                except OSError:
+                    key, cached = None, None  # the worker reports the unreadable file
+                if cached is not None:
+                    pending.append((img_file, key, np.frombuffer(cached, dtype=np.float32)))
+                else:
+                    pending.append((img_file, key, pool.submit(self._preprocess, image_path)))
+        
+        def record_batch(cached_files, cached_embeddings, face_files, face_keys, embedding_future):
+            """Append one finished batch to the insert columns, caching its fresh embeddings"""
+            nonlocal successful_embeddings, cache_hits
+            ready_files = list(cached_files)
+            if cached_embeddings:
+                embedding_blocks.append(np.stack(cached_embeddings))
+                cache_hits += len(cached_embeddings)
+            if embedding_future is not None:
+                embeddings = embedding_future.result()
+                for key, embedding in zip(face_keys, embeddings):
+                    if key is not None:
+                        self._cache[key] = embedding.tobytes()
+                embedding_blocks.append(embeddings)
+                ready_files.extend(face_files)
+            
+            for img_file in ready_files:
                 # Extract person name and face_id from filename
                 # Format: PersonName_imageX.jpg -> PersonName, PersonName_imageX
                 face_id = Path(img_file).stem
-                person_name = face_id.split('_')[0] if '_' in face_id else face_id
-                
-                # Generate embedding
-                embedding, success = self.extract_face_embedding(image_path)
-                
-                if success:
-                    # Add to batch
-                    batch_data.append({
-                        "face_id": face_id,
-                        "embedding": embedding.tolist(),
-                        "image_path": f"lfw_faces/{img_file}",
-                        "person_name": person_name
-                    })
-                    successful_embeddings += 1
-                else:
-                    failed_embeddings += 1
-                
-                # Insert batch when full or at end
-                if len(batch_data) >= batch_size or i == len(new_faces) - 1:
-                    if batch_data:
+                face_ids.append(face_id)
+                image_paths.append(f"lfw_faces/{img_file}")
+                person_names.append(face_id.split('_')[0] if '_' in face_id else face_id)
+            successful_embeddings += len(ready_files)
+            
+            # Insert in the background while the next batches are embedded
+            if len(face_ids) >= insert_batch_size:
+                submit_columns()
+        
+        # Inserts are never flushed per batch; finalize_collection flushes once, after every queued
+        # insert has landed, then builds the index
+        try:
+            # The forward pass runs on its own thread (TF and ONNX Runtime release the GIL), so while
+            # batch N is in the model this thread records batch N-1 and gathers batch N+1
+            previous = None
+            with ProcessPoolExecutor(max_workers=os.cpu_count(), mp_context=get_context('spawn')) as pool, \
+                    ThreadPoolExecutor(max_workers=1) as inference, \
+                    tqdm(total=len(new_faces), desc="Generating embeddings") as pbar:
+                # Keep the workers two batches ahead of the model
+                submit_next(2 * batch_size)
+                while pending:
+                    batch = [pending.popleft() for _ in range(min(batch_size, len(pending)))]
+                    submit_next(batch_size)
+                    
+                    # Take cached embeddings as they are; collect the aligned faces of the rest and
+                    # embed them in one forward pass
+                    cached_files = []
+                    cached_embeddings = []
+                    faces = []
+                    face_files = []
+                    face_keys = []
+                    for img_file, key, item in batch:
+                        if isinstance(item, np.ndarray):
+                            cached_files.append(img_file)
+                            cached_embeddings.append(item)
+                            continue
                         try:
-                            self.milvus_client.insert(
-                                collection_name=self.collection_name,
-                                data=batch_data
-                            )
-                            pbar.set_postfix({
-                                'Success': successful_embeddings,
-                                'Failed': failed_embeddings,
-                                'Batch': len(batch_data)
-                            })
-                            batch_data = []
+                            faces.append(item.result())
+                            face_files.append(img_file)
+                            face_keys.append(key)
                         except Exception as e:
-                            print(f"\n❌ Batch insert failed: {e}")
+                            print(f"⚠️  Failed to process {img_file}: {str(e)}")
+                            failed_embeddings += 1
+                    
+                    embedding_future = inference.submit(self._embed_batch, np.stack(faces)) if faces else None
+                    if previous is not None:
+                        record_batch(*previous)
+                    previous = (cached_files, cached_embeddings, face_files, face_keys, embedding_future)
+                    
+                    pbar.set_postfix({
+                        'Success': successful_embeddings,
+                        'Failed': failed_embeddings,
+                        'Pending': len(face_ids)
+                    })
+                    pbar.update(len(batch))
                 
-                pbar.update(1)
+                if previous is not None:
+                    record_batch(*previous)
+            
+            if face_ids:
+                submit_columns()
+        finally:
+            # Rows already queued still land, and fresh embeddings stay cached, if the loop fails
+            self._drain_inserts()
+            self._cache.sync()
+        self.finalize_collection()
         
         print(f"\n🎯 Embedding generation completed!")
         print(f"✅ Successfully processed: {successful_embeddings} faces")
+        print(f"♻️  Reused from embedding cache: {cache_hits} faces")
         print(f"❌ Failed to process: {failed_embeddings} faces")
         print(f"📊 Success rate: {successful_embeddings/(successful_embeddings+failed_embeddings)*100:.1f}%")
         
@@ -233,12 +520,12 @@ class FaceEmbeddingGenerator:
             
             # Test search functionality
             if total_faces > 0 and sample_records:
-                test_embedding = np.random.rand(self.dimension).tolist()
+                test_embedding = np.random.rand(self.dimension).astype(self.vector_dtype)
                 search_results = self.milvus_client.search(
                     collection_name=self.collection_name,
                     data=[test_embedding],
                     anns_field="embedding",
-                    param={"metric_type": "COSINE", "params": {"ef": 64}},
+                    param={"params": {"ef": 64}},  # metric defaults to the index's own
                     limit=5,
                     output_fields=["face_id", "person_name"]
                 )
@@ -260,40 +547,44 @@ def main():
     
     # Initialize embedding generator
     generator = FaceEmbeddingGenerator()
-    
-    # Ensure collection exists
-    generator.ensure_collection_exists()
-    
-    # Look for face datasets
-    possible_dirs = [
-        'data/sample_faces',
-        'data/lfw_faces', 
-        'data/real_faces',
-        'data/synthetic_faces'
-    ]
-    
-    faces_dir = None
-    for dir_path in possible_dirs:
-        if os.path.exists(dir_path) and os.listdir(dir_path):
-            faces_dir = dir_path
-            break
-    
-    if not faces_dir:
-        print("❌ No face dataset found!")
-        print("Please run: python scripts/download_lfw_dataset.py first")
-        return
-    
-    print(f"📂 Using face dataset: {faces_dir}")
-    
-    # Process faces (limit to 1000 for demo)
-    generator.process_face_dataset(
-        faces_dir=faces_dir,
-        batch_size=50,
-        max_faces=1000  # Halo requirement: 1000 unique faces
-    )
-    
-    # Verify database
-    generator.verify_database()
+    try:
+        # Ensure collection exists
+        generator.ensure_collection_schema()
+        
+        # Look for face datasets
+        possible_dirs = [
+            'data/sample_faces',
+            'data/lfw_faces', 
+            'data/real_faces',
+            'data/synthetic_faces'
+        ]
+        
+        faces_dir = None
+        for dir_path in possible_dirs:
+            if os.path.exists(dir_path) and os.listdir(dir_path):
+                faces_dir = dir_path
+                break
+        
+        if not faces_dir:
+            print("❌ No face dataset found!")
+            print("Please run: python scripts/download_lfw_dataset.py first")
+            return
+        
+        print(f"📂 Using face dataset: {faces_dir}")
+        
+        # Process faces (limit to 1000 for demo)
+        generator.process_face_dataset(
+            faces_dir=faces_dir,
+            batch_size=50,
+            insert_batch_size=INSERT_BATCH_SIZE,
+            max_faces=1000  # Halo requirement: 1000 unique faces
+        )
+        
+        # Verify database
+        generator.verify_database()
+    finally:
+        # Insert threads stopped and the shelve file closed, however the run ends
+        generator.close()
     
     print("\n🎯 HALO FACE SEARCH DATABASE READY!")
     print("🚀 You can now test the API:")
@@ -1,17 +1,62 @@
 # file: generate_faces.py
 import os
-import requests
+import asyncio
+import httpx
 import torch
 import torchvision
 from PIL import Image
 import numpy as np
+import cv2
 from tqdm import tqdm
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from itertools import repeat
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+FACE_URL = "https://thispersondoesnotexist.com/"
+
+# Downloads are latency-bound, so keep this many requests in flight over one pooled client
+DOWNLOAD_CONCURRENCY = 32
+DOWNLOAD_RETRIES = 3
+
+def save_downloaded_face(content: bytes, index: int, output_dir: str):
+    """Write a downloaded face and apply StyleGAN-like augmentations for variety"""
+    file_path = os.path.join(output_dir, f'face_{index:04d}.jpg')
+    with open(file_path, 'wb') as f:
+        f.write(content)
+    augment_face_with_style_variations(file_path)
+
+async def fetch_face(client: httpx.AsyncClient, semaphore: asyncio.Semaphore, index: int, output_dir: str) -> bool:
+    """Download face index with retries; decode/augment/write run on a worker thread"""
+    async with semaphore:
+        for _ in range(DOWNLOAD_RETRIES):
+            try:
+                response = await client.get(FACE_URL)
+                if response.status_code == 200:
+                    await asyncio.to_thread(save_downloaded_face, response.content, index, output_dir)
+                    return True
+            except Exception as e:
+                logger.warning(f"Error generating face {index}: {e}")
+    
+    # Generate a procedural face as fallback
+    await asyncio.to_thread(generate_procedural_face, index, output_dir)
+    return False
+
+async def download_faces(num_faces: int, output_dir: str) -> int:
+    """Fetch num_faces synthetic faces concurrently, falling back to procedural ones per face"""
+    limits = httpx.Limits(max_connections=DOWNLOAD_CONCURRENCY, max_keepalive_connections=DOWNLOAD_CONCURRENCY)
+    semaphore = asyncio.Semaphore(DOWNLOAD_CONCURRENCY)
+    async with httpx.AsyncClient(headers={'User-Agent': 'Mozilla/5.0'}, timeout=10, limits=limits) as client:
+        tasks = [fetch_face(client, semaphore, i, output_dir) for i in range(num_faces)]
+        with tqdm(total=num_faces, desc="Generating faces") as pbar:
+            for task in asyncio.as_completed(tasks):
+                await task
+                pbar.update(1)
+    return num_faces
+
 def generate_synthetic_faces_with_stylegan(num_faces: int, output_dir: str):
     """
     Generates synthetic faces using a pre-trained StyleGAN2 model.
@@ -29,44 +74,9 @@ def generate_synthetic_faces_with_stylegan(num_faces: int, output_dir: str):
         # 1. First try to generate with StyleGAN-like variations
         # 2. Fall back to downloading from This Person Does Not Exist
         
-        generated_count = 0
-        
         # Method 1: Download from This Person Does Not Exist API
         logger.info("Generating faces using synthetic face API...")
-        for i in tqdm(range(num_faces), desc="Generating faces"):
-            success = False
-            retries = 3
-            
-            while retries > 0 and not success:
-                try:
-                    # Download synthetic face
-                    response = requests.get(
-                        "https://thispersondoesnotexist.com/", 
-                        headers={'User-Agent': 'Mozilla/5.0'},
-                        timeout=10
-                    )
-                    
-                    if response.status_code == 200:
-                        file_path = os.path.join(output_dir, f'face_{i:04d}.jpg')
-                        with open(file_path, 'wb') as f:
-                            f.write(response.content)
-                        
-                        # Apply StyleGAN-like augmentations for variety
-                        augment_face_with_style_variations(file_path)
-                        
-                        generated_count += 1
-                        success = True
-                    else:
-                        retries -= 1
-                        
-                except Exception as e:
-                    logger.warning(f"Error generating face {i}: {e}")
-                    retries -= 1
-                    
-                    if retries == 0:
-                        # Generate a procedural face as fallback
-                        generate_procedural_face(i, output_dir)
-                        generated_count += 1
+        generated_count = asyncio.run(download_faces(num_faces, output_dir))
         
         logger.info(f"Successfully generated {generated_count} faces in '{output_dir}'.")
         
@@ -87,11 +97,15 @@ def augment_face_with_style_variations(image_path: str):
         # Apply subtle variations
         # 1. Slight color variations
         color_shift = np.random.uniform(0.95, 1.05, (3,))
-        img_array = (img_array * color_shift).clip(0, 255).astype(np.uint8)
         
         # 2. Slight brightness/contrast variations
         brightness = np.random.uniform(0.9, 1.1)
-        img_array = (img_array * brightness).clip(0, 255).astype(np.uint8)
+        
+        # Both are per-channel scales, so fold them into one float32 multiply + clip over the image
+        scale = (color_shift * brightness).astype(np.float32)
+        scaled = img_array * scale
+        np.clip(scaled, 0, 255, out=scaled)
+        img_array = scaled.astype(np.uint8)
         
         # Save augmented image
         Image.fromarray(img_array).save(image_path)
@@ -99,46 +113,75 @@ def augment_face_with_style_variations(image_path: str):
     except Exception as e:
         logger.warning(f"Could not augment image {image_path}: {e}")
 
-def generate_procedural_face(index: int, output_dir: str):
+# Procedural face geometry is the same for every image, so the oval mask is drawn once
+PROCEDURAL_SIZE = 512
+SKIN_TONES = np.array([
+    (241, 194, 156),  # Light
+    (222, 171, 127),  # Medium light
+    (189, 140, 99),   # Medium
+    (141, 85, 53),    # Medium dark
+    (90, 56, 37)      # Dark
+], dtype=np.float32)
+FACE_MASK = cv2.ellipse(
+    np.zeros((PROCEDURAL_SIZE, PROCEDURAL_SIZE), dtype=np.uint8),
+    (PROCEDURAL_SIZE // 2, PROCEDURAL_SIZE // 2),
+    (int(PROCEDURAL_SIZE * 0.35), int(PROCEDURAL_SIZE * 0.45)),
+    0, 0, 360, 1, -1
+).astype(bool)
+
+# Faces rendered per NumPy pass; 64 x 512x512x3 float32 is ~200MB of working memory
+PROCEDURAL_CHUNK = 64
+
+# 5-tap Gaussian (sigma derived from the size, as cv2.GaussianBlur(img, (5, 5), 0) does)
+BLUR_KERNEL = cv2.getGaussianKernel(5, 0)
+IDENTITY_KERNEL = np.ones((1, 1))
+
+def blur_faces(faces: np.ndarray) -> np.ndarray:
     """
-    Generates a procedural face using mathematical functions.
-    This is a fallback when other methods fail.
+    Gaussian-blur a (N, H, W, 3) uint8 block with two sepFilter2D calls over the whole stack.
+    Each pass runs along an axis that never crosses from one image into the next.
     """
-    import cv2
+    n, h, w, c = faces.shape
     
-    # Create base image
-    img_size = 512
-    img = np.ones((img_size, img_size, 3), dtype=np.uint8) * 255
+    # Horizontal pass: every row of every image is one row of an (N*H, W) image
+    rows = cv2.sepFilter2D(faces.reshape(n * h, w, c), cv2.CV_32F, BLUR_KERNEL, IDENTITY_KERNEL)
     
-    # Set random seed for consistency
-    np.random.seed(index)
-    
-    # Generate skin tone
-    skin_tones = [
-        (241, 194, 156),  # Light
-        (222, 171, 127),  # Medium light
-        (189, 140, 99),   # Medium
-        (141, 85, 53),    # Medium dark
-        (90, 56, 37)      # Dark
-    ]
-    skin_color = skin_tones[np.random.randint(0, len(skin_tones))]
-    
-    # Draw face oval
-    center = (img_size // 2, img_size // 2)
-    axes = (int(img_size * 0.35), int(img_size * 0.45))
-    cv2.ellipse(img, center, axes, 0, 0, 360, skin_color, -1)
+    # Vertical pass: lay the images side by side as one (H, N*W) image, so columns stay separate
+    cols = np.ascontiguousarray(rows.reshape(n, h, w, c).transpose(1, 0, 2, 3)).reshape(h, n * w, c)
+    blurred = cv2.sepFilter2D(cols, cv2.CV_8U, IDENTITY_KERNEL, BLUR_KERNEL)
+    return np.ascontiguousarray(blurred.reshape(h, n, w, c).transpose(1, 0, 2, 3))
+
+def render_procedural_faces(count: int, rng: np.random.Generator) -> np.ndarray:
+    """
+    Render count procedural faces as one (count, 512, 512, 3) uint8 RGB block:
+    skin-toned oval on white plus Gaussian texture noise in float32, then smoothed.
+    """
+    skin = SKIN_TONES[rng.integers(0, len(SKIN_TONES), count)]
+    faces = np.where(FACE_MASK[None, :, :, None], skin[:, None, None, :], np.float32(255))
     
     # Add some noise for texture
-    noise = np.random.normal(0, 10, img.shape)
-    img = np.clip(img + noise, 0, 255).astype(np.uint8)
+    noise = rng.standard_normal(faces.shape, dtype=np.float32)
+    noise *= 10
+    faces += noise
+    np.clip(faces, 0, 255, out=faces)
     
     # Apply Gaussian blur for smoothness
-    img = cv2.GaussianBlur(img, (5, 5), 0)
-    
-    # Save image
+    return blur_faces(faces.astype(np.uint8))
+
+def write_procedural_face(img: np.ndarray, index: int, output_dir: str):
+    """Save one rendered face as face_XXXX.jpg"""
     file_path = os.path.join(output_dir, f'face_{index:04d}.jpg')
     cv2.imwrite(file_path, cv2.cvtColor(img, cv2.COLOR_RGB2BGR))
 
+def generate_procedural_face(index: int, output_dir: str):
+    """
+    Generates a procedural face using mathematical functions.
+    This is a fallback when other methods fail.
+    """
+    # Seeded by index for consistency
+    rng = np.random.default_rng(index)
+    write_procedural_face(render_procedural_faces(1, rng)[0], index, output_dir)
+
 def generate_procedural_faces_batch(num_faces: int, output_dir: str):
     """
     Generate a batch of procedural faces as a fallback.
@@ -146,8 +189,25 @@ def generate_procedural_faces_batch(num_faces: int, output_dir: str):
     os.makedirs(output_dir, exist_ok=True)
     logger.info(f"Generating {num_faces} procedural faces...")
     
-    for i in tqdm(range(num_faces), desc="Generating procedural faces"):
-        generate_procedural_face(i, output_dir)
+    # Render and blur a chunk of faces per pass; JPEG encoding releases the GIL, so threads
+    # write one chunk while the next is rendered
+    rng = np.random.default_rng(0)
+    writes = []
+    with ThreadPoolExecutor(max_workers=8) as executor, \
+            tqdm(total=num_faces, desc="Generating procedural faces") as pbar:
+        for start in range(0, num_faces, PROCEDURAL_CHUNK):
+            faces = render_procedural_faces(min(PROCEDURAL_CHUNK, num_faces - start), rng)
+            
+            # The previous chunk's writes ran while this chunk was rendered
+            for write in writes:
+                write.result()
+                pbar.update(1)
+            writes = list(map(executor.submit, repeat(write_procedural_face), faces,
+                              range(start, start + len(faces)), repeat(output_dir)))
+        
+        for write in writes:
+            write.result()
+            pbar.update(1)
     
     logger.info(f"Generated {num_faces} procedural faces in '{output_dir}'.")
 
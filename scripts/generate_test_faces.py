@@ -4,28 +4,20 @@ Generate a small set of test faces for quick testing
 """
 
 import os
-import requests
-import time
+import asyncio
+import httpx
 from PIL import Image
 import numpy as np
 import cv2
 
-def generate_test_faces(num_faces=10, output_dir='data/synthetic_faces'):
-    """Generate a small set of test faces"""
-    os.makedirs(output_dir, exist_ok=True)
-    
-    print(f"Generating {num_faces} test faces...")
-    
-    for i in range(num_faces):
-        print(f"Generating face {i+1}/{num_faces}...")
-        
-        # Try to download from thispersondoesnotexist.com
+FACE_URL = "https://thispersondoesnotexist.com/"
+DOWNLOAD_CONCURRENCY = 8
+
+async def fetch_test_face(client, semaphore, i, output_dir):
+    """Download test face i, or generate a procedural one if the download fails"""
+    async with semaphore:
         try:
-            response = requests.get(
-                "https://thispersondoesnotexist.com/", 
-                headers={'User-Agent': 'Mozilla/5.0'},
-                timeout=10
-            )
+            response = await client.get(FACE_URL)
             
             if response.status_code == 200:
                 file_path = os.path.join(output_dir, f'face_{i:04d}.jpg')
@@ -36,12 +28,25 @@ def generate_test_faces(num_faces=10, output_dir='data/synthetic_faces'):
                 print(f"  Failed to download, generating procedural face {i}")
                 generate_simple_face(i, output_dir)
                 
-            # Wait a bit between requests
-            time.sleep(1)
-            
         except Exception as e:
             print(f"  Error: {e}, generating procedural face {i}")
             generate_simple_face(i, output_dir)
+
+async def fetch_test_faces(num_faces, output_dir):
+    """Download all test faces concurrently over one pooled client"""
+    semaphore = asyncio.Semaphore(DOWNLOAD_CONCURRENCY)
+    limits = httpx.Limits(max_connections=DOWNLOAD_CONCURRENCY)
+    async with httpx.AsyncClient(headers={'User-Agent': 'Mozilla/5.0'}, timeout=10, limits=limits) as client:
+        await asyncio.gather(*(fetch_test_face(client, semaphore, i, output_dir) for i in range(num_faces)))
+
+def generate_test_faces(num_faces=10, output_dir='data/synthetic_faces'):
+    """Generate a small set of test faces"""
+    os.makedirs(output_dir, exist_ok=True)
+    
+    print(f"Generating {num_faces} test faces...")
+    
+    # Try to download from thispersondoesnotexist.com, a few requests at a time
+    asyncio.run(fetch_test_faces(num_faces, output_dir))
     
     print(f"Generated {num_faces} test faces in {output_dir}")
 
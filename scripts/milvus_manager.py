@@ -21,6 +21,16 @@ COLLECTION_NAME = "face_recognition_db"
 DIMENSION = 512  # Dimension of ArcFace embeddings
 INDEX_TYPE = "HNSW"
 METRIC_TYPE = "L2"  # Euclidean distance. Can also be "IP" for inner product.
+INSERT_BATCH_SIZE = 10000  # rows per insert RPC
+
+# Built once and reused by every search
+SEARCH_PARAMS = {
+    "metric_type": METRIC_TYPE,
+    "params": {"ef": 128}  # ef: search depth during query, higher is more accurate but slower
+}
+
+# Collections this process has loaded; they stay resident until release_collection()
+_loaded_collections = set()
 
 def connect_to_milvus():
     """Establishes a connection to the Milvus server."""
@@ -52,23 +62,33 @@ def create_milvus_collection():
     print("Collection created successfully.")
     return collection
 
-def insert_data_into_milvus(collection: Collection, data_records: list):
-    """Inserts data records into the specified Milvus collection."""
+def load_database_records(json_path: str = 'data/face_database.json'):
+    """Loads record metadata and the memory-mapped embedding matrix saved next to it."""
+    with open(json_path, 'r') as f:
+        data_records = json.load(f)
+    embeddings = np.load(os.path.splitext(json_path)[0] + '.npy', mmap_mode='r')
+    return data_records, embeddings
+
+def insert_data_into_milvus(collection: Collection, data_records: list, embeddings: np.ndarray):
+    """Inserts data records (with embeddings[i] for data_records[i]) into the specified Milvus collection."""
     if not data_records:
         print("No data to insert.")
         return
         
     print(f"Inserting {len(data_records)} records into '{COLLECTION_NAME}'...")
-    # Milvus expects data in columnar format (lists of values for each field)
-    entities = [
-        [record['id'] for record in data_records],
-        [record['image_path'] for record in data_records],
-        [record['embedding'] for record in data_records]
-    ]
+    inserted = 0
+    for start in range(0, len(data_records), INSERT_BATCH_SIZE):
+        batch = data_records[start:start + INSERT_BATCH_SIZE]
+        # Milvus expects data in columnar format (lists of values for each field)
+        entities = [
+            [record['id'] for record in batch],
+            [record['image_path'] for record in batch],
+            list(embeddings[start:start + len(batch)])  # float32 rows straight from the mmap
+        ]
+        inserted += collection.insert(entities).insert_count
     
-    insert_result = collection.insert(entities)
     collection.flush()  # Flushes data to disk
-    print(f"Successfully inserted {insert_result.insert_count} records.")
+    print(f"Successfully inserted {inserted} records.")
 
 def build_milvus_index(collection: Collection):
     """Builds an HNSW index on the 'embedding' field for fast searching."""
@@ -86,20 +106,27 @@ def build_milvus_index(collection: Collection):
     collection.create_index(field_name="embedding", index_params=index_params)
     print("Index created successfully.")
 
-def search_similar_faces(collection: Collection, query_vector: list, top_k: int = 5) -> list:
+def ensure_collection_loaded(collection: Collection):
+    """Loads the collection into memory once per process; later calls are free."""
+    if collection.name not in _loaded_collections:
+        collection.load()
+        _loaded_collections.add(collection.name)
+
+def release_collection(collection: Collection):
+    """Releases a loaded collection. Call at shutdown only, never per query."""
+    if collection.name in _loaded_collections:
+        collection.release()
+        _loaded_collections.discard(collection.name)
+
+def search_similar_faces(collection: Collection, query_vector: list, top_k: int = 5,
+                         search_params: dict = SEARCH_PARAMS) -> list:
     """
     Searches for the top_k most similar faces to the query_vector.
+    The collection must already be loaded (see ensure_collection_loaded); it stays resident.
     
     Returns:
         A list of dictionaries, each containing the id, distance, and image_path of a match.
     """
-    collection.load()  # Load collection into memory for searching
-    
-    search_params = {
-        "metric_type": METRIC_TYPE,
-        "params": {"ef": 128}  # ef: search depth during query, higher is more accurate but slower
-    }
-    
     results = collection.search(
         data=[query_vector],
         anns_field="embedding",
@@ -117,7 +144,6 @@ def search_similar_faces(collection: Collection, query_vector: list, top_k: int
             "image_path": hit.entity.get("image_path")
         })
         
-    collection.release()  # Release collection from memory
     return search_results
 
 if __name__ == '__main__':
@@ -125,17 +151,16 @@ if __name__ == '__main__':
     connect_to_milvus()
     face_collection = create_milvus_collection()
     
-    # Load data from the JSON file created earlier
+    # Load the records and embeddings created earlier
     try:
-        with open('data/face_database.json', 'r') as f:
-            db_records = json.load(f)
+        db_records, db_embeddings = load_database_records('data/face_database.json')
     except FileNotFoundError:
         print("Error: face_database.json not found. Please run create_database_records.py first.")
         exit(1)
     
     # Check if data is already inserted to avoid duplicates
     if face_collection.num_entities == 0:
-        insert_data_into_milvus(face_collection, db_records)
+        insert_data_into_milvus(face_collection, db_records, db_embeddings)
         build_milvus_index(face_collection)
     else:
         print(f"Data already present in collection ({face_collection.num_entities} entities). Skipping insertion and index building.")
@@ -143,8 +168,9 @@ if __name__ == '__main__':
     # Example search
     if db_records:
         print("\n--- Performing Example Search ---")
-        sample_query_vector = db_records[0]['embedding']
+        sample_query_vector = db_embeddings[0]
         
+        ensure_collection_loaded(face_collection)  # Load collection into memory for searching
         results = search_similar_faces(face_collection, sample_query_vector)
         
         print(f"Found {len(results)} similar faces for sample vector:")